@@ -0,0 +1,337 @@
+import os
+import shutil
+import logging
+import json
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# How attachments are placed in the obsidian vault
+# "copy": an independent copy of the file
+# "hardlink": a hard link to the exported file, only possible on the same filesystem
+# "reflink": a copy-on-write copy (copy_file_range), e.g. on Btrfs or XFS
+COPY_MODES = ["copy", "hardlink", "reflink"]
+
+
+def _copy_file_range(source_path, destination_path):
+    """
+    Copies a file with os.copy_file_range, letting the kernel share the data blocks
+    (reflink) where the filesystem supports it.
+    """
+    with open(source_path, "rb") as source_file, open(
+        destination_path, "wb"
+    ) as destination_file:
+        remaining = os.fstat(source_file.fileno()).st_size
+        while remaining > 0:
+            copied = os.copy_file_range(
+                source_file.fileno(), destination_file.fileno(), remaining
+            )
+            if copied == 0:
+                break
+            remaining -= copied
+    shutil.copymode(source_path, destination_path)
+
+
+def copy_file(source_path, destination_path, copy_mode="copy"):
+    """
+    Copies a single file, replacing the destination if it exists.
+    Hardlinks and reflinks fall back to a normal copy when they are not possible,
+    e.g. when the source and destination are on different filesystems.
+
+    Args:
+        source_path (str): The file to copy.
+        destination_path (str): The full path of the copy.
+        copy_mode (str): One of COPY_MODES.
+    """
+    if copy_mode == "hardlink":
+        try:
+            if os.path.lexists(destination_path):
+                os.unlink(destination_path)
+            os.link(source_path, destination_path)
+            return
+        except OSError as e:
+            logging.info(f"Could not hardlink {source_path}, copying instead: {e}")
+    elif copy_mode == "reflink" and hasattr(os, "copy_file_range"):
+        try:
+            # Never write through an existing hardlink to the exported file
+            if os.path.lexists(destination_path):
+                os.unlink(destination_path)
+            _copy_file_range(source_path, destination_path)
+            return
+        except OSError as e:
+            logging.info(f"Could not reflink {source_path}, copying instead: {e}")
+
+    # Never write through an existing hardlink from an earlier run, which may be linked to
+    # the source or to another exported file
+    if os.path.lexists(destination_path):
+        os.unlink(destination_path)
+    shutil.copy(source_path, destination_path)
+
+
+def copy_files(
+    copy_jobs, max_workers=8, copy_mode="copy", export_source=None, journal=None
+):
+    """
+    Copies files concurrently using a bounded pool of threads.
+
+    Args:
+        copy_jobs (dict): Destination file path -> source file path. Keying by destination
+            means that when several files map to the same destination, the last one added wins,
+            as it would when copying one at a time.
+        max_workers (int): The maximum number of files copied at the same time.
+        copy_mode (str): One of COPY_MODES.
+        export_source: The export_source the source paths are from (e.g. a zip archive),
+            or None for files on disk.
+        journal (migration_checkpoint.ProgressJournal): Records each file copied, and the
+            files it recorded before a migration was interrupted are not copied again.
+
+    Returns:
+        dict: Summary of the run with the number of files copied, failed and resumed (copied
+            before the migration was interrupted), bytes copied, the destination paths of the
+            failed files and the elapsed seconds.
+    """
+    if copy_mode not in COPY_MODES:
+        raise ValueError(f"copy_mode must be one of {COPY_MODES}, not {copy_mode!r}")
+    copy = copy_file if export_source is None else export_source.copy_file
+    completed = journal.completed("attachments") if journal is not None else {}
+
+    def copy_job(job):
+        destination_path, source_path = job
+        entry = completed.get(destination_path)
+        if (
+            entry
+            and entry["source"] == source_path
+            and os.path.exists(destination_path)
+        ):
+            return "resumed", entry["size"]
+        try:
+            copy(source_path, destination_path, copy_mode)
+            logging.info(f"Copied file: {source_path} to {destination_path}")
+            size = os.path.getsize(destination_path)
+            if journal is not None:
+                journal.record(
+                    "attachments",
+                    destination_path,
+                    {"source": source_path, "size": size},
+                )
+            return "copied", size
+        except Exception as e:
+            logging.error(f"Failed to copy file: {source_path}. Error: {e}")
+            return "failed", None
+
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        results = list(executor.map(copy_job, copy_jobs.items()))
+
+    summary = {
+        "files_copied": 0,
+        "files_failed": 0,
+        "files_resumed": 0,
+        "bytes_copied": 0,
+        "failed_files": [],
+    }
+    for destination_path, (outcome, size) in zip(copy_jobs, results):
+        summary[f"files_{outcome}"] += 1
+        if outcome == "failed":
+            summary["failed_files"].append(destination_path)
+        elif outcome == "copied":
+            summary["bytes_copied"] += size
+    summary["seconds"] = time.perf_counter() - start_time
+    return summary
+
+
+def file_hash(file_path):
+    """
+    Returns the BLAKE2b hex digest of a file's content, read in 1 MB chunks.
+    """
+    digest = hashlib.blake2b()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_manifest(manifest_path):
+    """
+    Loads a manifest written by save_manifest, or returns an empty one if there is none.
+    """
+    if not os.path.exists(manifest_path):
+        return {}
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        logging.error(
+            f"Failed to read manifest {manifest_path}, ignoring it. Error: {e}"
+        )
+        return {}
+
+
+def save_manifest(manifest, manifest_path):
+    """
+    Saves a manifest as JSON, replacing the previous one only once it is fully written.
+    """
+    os.makedirs(os.path.dirname(manifest_path) or ".", exist_ok=True)
+    temporary_path = f"{manifest_path}.tmp"
+    with open(temporary_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(temporary_path, manifest_path)
+
+
+def sync_files(
+    copy_jobs,
+    base_directory,
+    manifest_path,
+    max_workers=8,
+    copy_mode="copy",
+    verify_hash=False,
+    export_source=None,
+    journal=None,
+):
+    """
+    Incrementally syncs files, copying only those that are new or changed since the last sync.
+
+    A manifest records the source path, size, mtime and (with verify_hash) content hash of each
+    destination file. A file is copied again when its source, size or mtime changed, unless
+    verify_hash is set and its content hash is unchanged (e.g. a re-export with new timestamps).
+    Destination files in the manifest that are no longer in copy_jobs are deleted; files not
+    written by a sync are never deleted.
+
+    Args:
+        copy_jobs (dict): Destination file path -> source file path, as for copy_files.
+        base_directory (str): Destination paths are stored in the manifest relative to this directory.
+        manifest_path (str): Path of the manifest JSON file.
+        max_workers (int): The maximum number of files checked or copied at the same time.
+        copy_mode (str): One of COPY_MODES.
+        verify_hash (bool): Compare content hashes of files whose mtime changed.
+        export_source: The export_source the source paths are from, or None for files on disk.
+        journal (migration_checkpoint.ProgressJournal): Records the manifest entry of each
+            file synced, as for copy_files.
+
+    Returns:
+        dict: Summary as for copy_files, plus the number of unchanged and deleted files.
+    """
+    if copy_mode not in COPY_MODES:
+        raise ValueError(f"copy_mode must be one of {COPY_MODES}, not {copy_mode!r}")
+
+    previous_manifest = load_manifest(manifest_path)
+    if export_source is None:
+        copy, source_hash = copy_file, file_hash
+    else:
+        copy, source_hash = export_source.copy_file, export_source.file_hash
+    completed = journal.completed("attachments") if journal is not None else {}
+
+    def sync_job(job):
+        destination_path, source_path = job
+        manifest_key = os.path.relpath(destination_path, base_directory)
+        entry = completed.get(destination_path)
+        if (
+            entry
+            and entry["source"] == source_path
+            and os.path.exists(destination_path)
+        ):
+            return manifest_key, entry, "resumed"
+        try:
+            if export_source is None:
+                source_stat = os.stat(source_path)
+                size, mtime_ns = source_stat.st_size, source_stat.st_mtime_ns
+            else:
+                size, mtime_ns = export_source.stat(source_path)
+            entry = {"source": source_path, "size": size, "mtime_ns": mtime_ns}
+            outcome = "copied"
+            previous_entry = previous_manifest.get(manifest_key)
+            if (
+                previous_entry
+                and previous_entry["source"] == source_path
+                and previous_entry["size"] == size
+                and os.path.exists(destination_path)
+            ):
+                if previous_entry["mtime_ns"] == mtime_ns:
+                    outcome, entry = "unchanged", previous_entry
+                elif verify_hash and previous_entry.get("hash") == source_hash(
+                    source_path
+                ):
+                    outcome, entry["hash"] = "unchanged", previous_entry["hash"]
+
+            if outcome == "copied":
+                copy(source_path, destination_path, copy_mode)
+                if verify_hash:
+                    entry["hash"] = file_hash(destination_path)
+                logging.info(f"Copied file: {source_path} to {destination_path}")
+            if journal is not None:
+                journal.record("attachments", destination_path, entry)
+            return manifest_key, entry, outcome
+        except Exception as e:
+            logging.error(f"Failed to copy file: {source_path}. Error: {e}")
+            # Keep the previous entry so the file is retried, not deleted, next time
+            return manifest_key, previous_manifest.get(manifest_key), "failed"
+
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        results = list(executor.map(sync_job, copy_jobs.items()))
+
+    manifest = {}
+    summary = {
+        "files_copied": 0,
+        "files_failed": 0,
+        "files_unchanged": 0,
+        "files_resumed": 0,
+        "files_deleted": 0,
+        "bytes_copied": 0,
+        "failed_files": [],
+    }
+    for (destination_path, _), (manifest_key, entry, outcome) in zip(
+        copy_jobs.items(), results
+    ):
+        summary[f"files_{outcome}"] += 1
+        if outcome == "failed":
+            summary["failed_files"].append(destination_path)
+        if entry is not None:
+            manifest[manifest_key] = entry
+        if outcome == "copied":
+            summary["bytes_copied"] += entry["size"]
+
+    # Delete files from earlier syncs that are no longer in the export
+    for manifest_key in previous_manifest.keys() - manifest.keys():
+        destination_path = os.path.join(base_directory, manifest_key)
+        try:
+            if os.path.lexists(destination_path):
+                os.unlink(destination_path)
+                logging.info(
+                    f"Deleted file no longer in the export: {destination_path}"
+                )
+            summary["files_deleted"] += 1
+            # Remove folders left empty, e.g. a deleted document folder
+            folder = os.path.dirname(destination_path)
+            while os.path.normpath(folder) != os.path.normpath(base_directory):
+                if os.listdir(folder):
+                    break
+                os.rmdir(folder)
+                folder = os.path.dirname(folder)
+        except Exception as e:
+            logging.error(f"Failed to delete {destination_path}. Error: {e}")
+            manifest[manifest_key] = previous_manifest[manifest_key]
+
+    save_manifest(manifest, manifest_path)
+    summary["seconds"] = time.perf_counter() - start_time
+    return summary
+
+
+def log_copy_summary(summary):
+    """
+    Logs and prints the throughput of a copy run returned by copy_files or sync_files.
+    """
+    seconds = max(summary["seconds"], 1e-9)
+    megabytes = summary["bytes_copied"] / (1024 * 1024)
+    message = (
+        f"Copied {summary['files_copied']} files ({megabytes:.1f} MB) in {seconds:.2f}s: "
+        f"{summary['files_copied'] / seconds:.1f} files/s, {megabytes / seconds:.1f} MB/s"
+    )
+    if "files_unchanged" in summary:
+        message += f", {summary['files_unchanged']} unchanged, {summary['files_deleted']} deleted"
+    if summary.get("files_resumed"):
+        message += f", {summary['files_resumed']} already copied before the resume"
+    if summary["files_failed"]:
+        message += f", {summary['files_failed']} failed (see log)"
+    logging.info(message)
+    print(message)
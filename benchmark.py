@@ -0,0 +1,332 @@
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+from ast import literal_eval
+import synthetic_export
+
+package_directory = os.path.dirname(os.path.abspath(__file__))
+
+# The settings of enduser_config.py a benchmark runs with, whatever the user's settings are,
+# so runs are comparable: a full migration that copies and writes everything
+benchmark_settings = {
+    "empty_obsidian_vault_dir_prior_to_running_the_script": True,
+    "types_to_tags": True,
+    "types_prepend_text": "TYPE-",
+    "case_insensitive_file_names": False,
+    "tags_emit_all_parent_paths": False,
+    "save_TB_Refactored_json_files": False,
+    "attachment_copy_mode": "copy",
+    "attachment_copy_workers": 8,
+    "incremental_attachment_sync": False,
+    "attachment_sync_verify_hash": False,
+    "incremental_migration": False,
+    "incremental_migration_verify_hash": False,
+    "optional_notes_body_transforms": [],
+    "save_vault_link_index": True,
+    "verify_migration_integrity": False,
+    "integrity_check_verify_checksums": False,
+    "profile_with_cprofile": False,
+    "profile_with_tracemalloc": False,
+    "use_sqlite_store": False,
+}
+
+# Runs the migration of ./export to ./obsidian in the current directory with the benchmark
+# settings, whatever the directories in enduser_config.py are, so a benchmark never touches
+# a real brain or vault
+migration_runner = """
+import sys
+sys.path.insert(0, {package_directory!r})
+import enduser_config as config
+config.dir_location_of_Brain_folder = "./export"
+config.dir_location_of_obsidian_vault = "./obsidian"
+for name, value in {settings!r}.items():
+    setattr(config, name, value)
+sys.argv = [
+    "thebrain2markdown.py", "--workers", "{workers}", "--profile-report", {report_path!r}
+]
+import thebrain2markdown
+thebrain2markdown.main()
+"""
+
+
+def prepare_export(run_directory, thoughts, seed):
+    """
+    Generates the synthetic export of a benchmark run, unless it was already generated
+    with the same size and seed.
+
+    Returns:
+        float: The seconds spent generating the export, 0 if it was reused.
+    """
+    export_directory = os.path.join(run_directory, "export")
+    marker_path = os.path.join(run_directory, "export.json")
+    marker = {"thoughts": thoughts, "seed": seed}
+    if os.path.exists(marker_path):
+        with open(marker_path, "r", encoding="utf-8") as f:
+            if json.load(f) == marker:
+                return 0.0
+
+    start_time = time.perf_counter()
+    synthetic_export.generate_export(export_directory, thoughts, seed)
+    with open(marker_path, "w", encoding="utf-8") as f:
+        json.dump(marker, f)
+    return time.perf_counter() - start_time
+
+
+def run_migration(run_directory, workers=1, settings=None):
+    """
+    Runs the full migration in a separate process with settings (by default
+    benchmark_settings) and returns its profile report (see stage_profiler).
+    """
+    if settings is None:
+        settings = benchmark_settings
+    # A report left by an earlier run is never read as this run's
+    report_path = os.path.join(run_directory, "logs", "benchmark_profile.json")
+    if os.path.exists(report_path):
+        os.remove(report_path)
+    subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            migration_runner.format(
+                package_directory=package_directory,
+                settings=settings,
+                workers=workers,
+                report_path=report_path,
+            ),
+        ],
+        cwd=run_directory,
+        check=True,
+        stdout=subprocess.DEVNULL,
+    )
+    if not os.path.exists(report_path):
+        raise RuntimeError(
+            f"The migration did not write its profile report {report_path}"
+        )
+    with open(report_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def summarize_report(report, settings, workers):
+    """
+    Returns the result of a run for benchmark_results.json: its settings, total time,
+    peak RSS and the wall time of each stage.
+    """
+    return {
+        "settings": settings,
+        "workers": workers,
+        "total_wall_seconds": report["total_wall_seconds"],
+        "peak_rss_mb": report["peak_rss_mb"],
+        "stages": {stage["name"]: stage["wall_seconds"] for stage in report["stages"]},
+    }
+
+
+def print_comparison(result, other_result, setting):
+    """
+    Prints the times of a run and of the same run with the other value of a setting, stage
+    by stage.
+    """
+    value = result["settings"][setting]
+    other_value = other_result["settings"][setting]
+    print(f"  {setting:<22} {value!s:>10} {other_value!s:>10}")
+    timings = {"total": result["total_wall_seconds"], **result["stages"]}
+    other_timings = {
+        "total": other_result["total_wall_seconds"],
+        **other_result["stages"],
+    }
+    for stage in dict.fromkeys([*timings, *other_timings]):
+        columns = [
+            "-" if seconds is None else f"{seconds:.3f}s"
+            for seconds in (timings.get(stage), other_timings.get(stage))
+        ]
+        print(f"  {stage:<22} {columns[0]:>10} {columns[1]:>10}")
+    peak_rss = [f"{run['peak_rss_mb'] or 0:.0f} MB" for run in (result, other_result)]
+    print(f"  {'peak RSS':<22} {peak_rss[0]:>10} {peak_rss[1]:>10}")
+
+
+def compare_with_baseline(results, baseline, tolerance=0.25, min_seconds=0.05):
+    """
+    Compares the wall times of each size and stage with a baseline.
+
+    A time is a regression if it is more than tolerance (a fraction) slower than the
+    baseline and at least min_seconds slower, so very short stages do not fail on noise.
+
+    Raises:
+        ValueError: If a size was run with other settings or workers than its baseline.
+
+    Returns:
+        list: The regressions, as {"thoughts", "stage", "baseline_seconds", "seconds"}.
+    """
+    regressions = []
+    for thoughts, result in results.items():
+        baseline_result = baseline.get(thoughts)
+        if not baseline_result:
+            continue
+        baseline_settings = baseline_result.get("settings", {})
+        differences = {
+            name: (baseline_settings.get(name), value)
+            for name, value in result["settings"].items()
+            if baseline_settings.get(name) != value
+        }
+        if baseline_result.get("workers") != result["workers"]:
+            differences["workers"] = (baseline_result.get("workers"), result["workers"])
+        if differences:
+            raise ValueError(
+                f"the baseline of {thoughts} thoughts was run with other settings "
+                f"(baseline, this run): {differences}"
+            )
+        timings = {"total": result["total_wall_seconds"], **result["stages"]}
+        baseline_timings = {
+            "total": baseline_result["total_wall_seconds"],
+            **baseline_result["stages"],
+        }
+        for stage, seconds in timings.items():
+            baseline_seconds = baseline_timings.get(stage)
+            if baseline_seconds is None:
+                continue
+            if (
+                seconds > baseline_seconds * (1 + tolerance)
+                and seconds - baseline_seconds >= min_seconds
+            ):
+                regressions.append(
+                    {
+                        "thoughts": thoughts,
+                        "stage": stage,
+                        "baseline_seconds": baseline_seconds,
+                        "seconds": seconds,
+                    }
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time the migration of synthetic exports of different sizes."
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[1000, 10000, 100000, 1000000],
+        help="Numbers of thoughts to benchmark (default: 1000 10000 100000 1000000).",
+    )
+    parser.add_argument("--seed", type=int, default=1, help="Seed of the exports.")
+    parser.add_argument(
+        "--workers", type=int, default=1, help="Markdown workers (default: 1)."
+    )
+    parser.add_argument(
+        "--set",
+        nargs="+",
+        default=[],
+        metavar="NAME=VALUE",
+        help="Benchmark with other settings than benchmark_settings, "
+        "e.g. --set use_sqlite_store=True.",
+    )
+    parser.add_argument(
+        "--directory",
+        default="./benchmark_runs",
+        help="Directory of the exports and vaults (default: ./benchmark_runs).",
+    )
+    parser.add_argument(
+        "--compare-store",
+        action="store_true",
+        help="Also run each size with the other use_sqlite_store setting and print both, "
+        "to measure the cost of the SQLite store.",
+    )
+    parser.add_argument(
+        "--baseline",
+        default="./benchmark_baseline.json",
+        help="Results to compare with (default: ./benchmark_baseline.json).",
+    )
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="Save the results as the new baseline instead of comparing with it.",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="Fraction a stage may be slower than the baseline (default: 0.25).",
+    )
+    args = parser.parse_args()
+
+    settings = dict(benchmark_settings)
+    for setting in args.set:
+        name, value = setting.split("=", 1)
+        if name not in settings:
+            parser.error(f"Unknown setting {name}, available: {list(settings)}")
+        settings[name] = literal_eval(value)
+
+    results = {}
+    for thoughts in args.sizes:
+        run_directory = os.path.abspath(os.path.join(args.directory, str(thoughts)))
+        os.makedirs(run_directory, exist_ok=True)
+        generation_seconds = prepare_export(run_directory, thoughts, args.seed)
+        if generation_seconds:
+            print(f"{thoughts} thoughts: export generated in {generation_seconds:.1f}s")
+
+        report = run_migration(run_directory, args.workers, settings)
+        result = summarize_report(report, settings, args.workers)
+        results[str(thoughts)] = result
+        print(
+            f"{thoughts} thoughts: {report['total_wall_seconds']:.2f}s, "
+            f"peak RSS {report['peak_rss_mb'] or 0:.0f} MB"
+        )
+        if not args.compare_store:
+            for stage in report["stages"]:
+                print(f"  {stage['name']:<22} {stage['wall_seconds']:8.3f}s")
+            continue
+
+        # The same run with the other store setting, kept apart from the result that is
+        # compared with the baseline
+        store_settings = {
+            **settings,
+            "use_sqlite_store": not settings["use_sqlite_store"],
+        }
+        store_report = run_migration(run_directory, args.workers, store_settings)
+        result["store_comparison"] = summarize_report(
+            store_report, store_settings, args.workers
+        )
+        print_comparison(result, result["store_comparison"], "use_sqlite_store")
+
+    with open(
+        os.path.join(args.directory, "benchmark_results.json"), "w", encoding="utf-8"
+    ) as f:
+        json.dump(results, f, indent=4)
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, "r", encoding="utf-8") as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=4)
+        print(f"Baseline saved to: {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, run with --save-baseline to create one")
+        return
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    try:
+        regressions = compare_with_baseline(results, baseline, args.tolerance)
+    except ValueError as e:
+        print(f"Not compared with the baseline: {e}")
+        sys.exit(2)
+    for regression in regressions:
+        print(
+            f"REGRESSION {regression['thoughts']} thoughts, {regression['stage']}: "
+            f"{regression['seconds']:.3f}s, baseline {regression['baseline_seconds']:.3f}s"
+        )
+    if regressions:
+        sys.exit(1)
+    print("No regressions against the baseline.")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,3 +3,20 @@ dir_location_of_obsidian_vault = "./obsidian"
 empty_obsidian_vault_dir_prior_to_running_the_script = True
 types_to_tags = True
 types_prepend_text = "TYPE-"
+case_insensitive_file_names = False
+tags_emit_all_parent_paths = False
+save_TB_Refactored_json_files = False
+attachment_copy_mode = "copy"
+attachment_copy_workers = 8
+incremental_attachment_sync = False
+attachment_sync_verify_hash = False
+incremental_migration = False
+incremental_migration_verify_hash = False
+markdown_workers = 1
+optional_notes_body_transforms = []
+save_vault_link_index = False
+verify_migration_integrity = False
+integrity_check_verify_checksums = False
+profile_with_cprofile = False
+profile_with_tracemalloc = False
+use_sqlite_store = False
@@ -0,0 +1,280 @@
+import os
+import io
+import ntpath
+import time
+import shutil
+import hashlib
+import logging
+import zipfile
+import threading
+import utility as util
+import attachment_copier
+
+
+class DirectoryExportSource:
+    """
+    A TheBrain export extracted to a directory.
+
+    Files are addressed by the paths the source returns from file_path and scan,
+    here ordinary filesystem paths.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        pass
+
+    def file_path(self, *parts):
+        """
+        Returns the path of a file in the export, e.g. file_path(node_id, "Notes.md").
+        """
+        return os.path.join(self.path, *parts)
+
+    def scan(self):
+        """
+        Returns the index of the export's thought folders (see util.scan_export_directory).
+        """
+        return util.scan_export_directory(self.path)
+
+    def open_text(self, path, encoding="utf-8"):
+        return open(path, "r", encoding=encoding)
+
+    def stat(self, path):
+        """
+        Returns the size and mtime_ns of a file.
+        """
+        file_stat = os.stat(path)
+        return file_stat.st_size, file_stat.st_mtime_ns
+
+    def file_hash(self, path):
+        return attachment_copier.file_hash(path)
+
+    def is_same_file(self, path, destination_path):
+        """
+        Returns True if destination_path is the file itself, e.g. a hardlink to it.
+        """
+        return os.path.samefile(path, destination_path)
+
+    def copy_file(self, path, destination_path, copy_mode="copy"):
+        attachment_copier.copy_file(path, destination_path, copy_mode)
+
+
+class ZipExportSource:
+    """
+    A TheBrain export read straight from its zip archive, without extracting it.
+
+    Files are addressed by their member names in the archive. JSON records and Notes.md are
+    streamed from their members and attachments are copied member by member into the vault.
+    The export may be at the root of the archive or in a folder of it (the folder of
+    thoughts.json).
+
+    The archive is opened lazily and once per process, so a source can be shared with the
+    markdown workers; members may be read from several threads at once.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._archive = None
+        self._archive_pid = None
+        self._members = None
+        self._prefix = None
+
+    def __getstate__(self):
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        with self._lock:
+            if self._archive is not None:
+                self._archive.close()
+            self._archive = None
+
+    def _open(self):
+        """
+        Returns the open archive and its members by name, opening the archive if it is not
+        open in this process (e.g. in a forked worker, which must not share the file offset).
+        """
+        with self._lock:
+            if self._archive is None or self._archive_pid != os.getpid():
+                self._archive = zipfile.ZipFile(self.path)
+                self._archive_pid = os.getpid()
+                # Some archivers store Windows path separators
+                self._members = {
+                    info.filename.replace("\\", "/"): info
+                    for info in self._archive.infolist()
+                }
+                thoughts_paths = sorted(
+                    (name for name in self._members if name.endswith("thoughts.json")),
+                    key=lambda name: name.count("/"),
+                )
+                self._prefix = (
+                    thoughts_paths[0][: -len("thoughts.json")] if thoughts_paths else ""
+                )
+            return self._archive, self._members
+
+    def _member(self, path):
+        archive, members = self._open()
+        info = members.get(path)
+        if info is None:
+            raise FileNotFoundError(f"{path} is not in {self.path}")
+        return archive, info
+
+    def file_path(self, *parts):
+        """
+        Returns the member name of a file in the export, e.g. file_path(node_id, "Notes.md").
+        """
+        self._open()
+        return self._prefix + "/".join(parts)
+
+    def scan(self):
+        """
+        Builds the index of the export's thought folders from the archive's directory,
+        in the format of util.scan_export_directory, with member names as paths.
+        """
+        _, members = self._open()
+        export_index = {}
+        folders = {}
+        notes_files = {}
+        for name, info in members.items():
+            if not name.startswith(self._prefix):
+                continue
+            parts = name[len(self._prefix) :].rstrip("/").split("/")
+            if not _is_safe_member_path(parts):
+                logging.warning(f"Skipped member with an unsafe path: {name}")
+                continue
+            if len(parts) < 2 and not info.is_dir():
+                continue
+            folder_index = export_index.setdefault(
+                parts[0], {"notes": None, "files": [], "md_images": [], "folders": []}
+            )
+            if len(parts) < 2:
+                continue
+            try:
+                if len(parts) == 2 and not info.is_dir():
+                    if parts[1].lower() == "notes.md":
+                        notes_files.setdefault(parts[0], []).append(
+                            (parts[1], name, info.file_size, _zip_mtime_ns(info))
+                        )
+                    else:
+                        folder_index["files"].append((parts[1], name, info.file_size))
+                elif parts[1] == ".data":
+                    if (
+                        len(parts) == 4
+                        and parts[2] == "md-images"
+                        and not info.is_dir()
+                    ):
+                        folder_index["md_images"].append(
+                            (parts[3], name, info.file_size)
+                        )
+                else:
+                    # Other sub-folders, with the relative paths of their folders and files
+                    folder, sub_folders = folders.get(
+                        (parts[0], parts[1]), (None, None)
+                    )
+                    if folder is None:
+                        folder = (
+                            parts[1],
+                            self._prefix + "/".join(parts[:2]),
+                            ["."],
+                            [],
+                        )
+                        sub_folders = {"."}
+                        folders[(parts[0], parts[1])] = (folder, sub_folders)
+                        folder_index["folders"].append(folder)
+                    folder_parts = parts[2:] if info.is_dir() else parts[2:-1]
+                    for depth in range(1, len(folder_parts) + 1):
+                        sub_folder = os.path.join(".", *folder_parts[:depth])
+                        if sub_folder not in sub_folders:
+                            sub_folders.add(sub_folder)
+                            folder[2].append(sub_folder)
+                    if not info.is_dir():
+                        folder[3].append(
+                            (os.path.join(".", *parts[2:]), name, info.file_size)
+                        )
+            except Exception as e:
+                logging.error(f"Failed to scan: {name}. Error: {e}")
+
+        for folder_name, folder_notes_files in notes_files.items():
+            util.add_notes_file(export_index[folder_name], sorted(folder_notes_files))
+        return export_index
+
+    def open_text(self, path, encoding="utf-8"):
+        archive, info = self._member(path)
+        return io.TextIOWrapper(archive.open(info), encoding=encoding)
+
+    def stat(self, path):
+        """
+        Returns the size and modified time (as mtime_ns) of a member.
+        """
+        _, info = self._member(path)
+        return info.file_size, _zip_mtime_ns(info)
+
+    def file_hash(self, path):
+        archive, info = self._member(path)
+        digest = hashlib.blake2b()
+        with archive.open(info) as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def is_same_file(self, path, destination_path):
+        return False
+
+    def copy_file(self, path, destination_path, copy_mode="copy"):
+        """
+        Decompresses a member straight into destination_path. Members can not be hardlinked
+        or reflinked, so every copy_mode makes a copy.
+        """
+        archive, info = self._member(path)
+        # Never write through an existing hardlink to a file of an extracted export
+        if os.path.lexists(destination_path):
+            os.unlink(destination_path)
+        with archive.open(info) as source_file, open(
+            destination_path, "wb"
+        ) as destination_file:
+            shutil.copyfileobj(source_file, destination_file, 1024 * 1024)
+
+
+def _is_safe_member_path(parts):
+    """
+    Returns False if a member's path could point outside the folder it is copied to (zip
+    slip): if any segment is empty, "." or "..", absolute or has a drive letter.
+    """
+    return not any(
+        part in ("", ".", "..") or os.path.isabs(part) or ntpath.splitdrive(part)[0]
+        for part in parts
+    )
+
+
+def _zip_mtime_ns(info):
+    """
+    Returns the modified time of a zip member (local time, 2 second resolution) in ns.
+    """
+    return int(time.mktime(info.date_time + (0, 0, -1))) * 1_000_000_000
+
+
+def open_export_source(path):
+    """
+    Returns the export source for dir_location_of_Brain_folder: a ZipExportSource if it is a
+    zip archive, otherwise a DirectoryExportSource.
+    """
+    if os.path.isfile(path) and zipfile.is_zipfile(path):
+        logging.info(f"Reading the export from the zip archive: {path}")
+        return ZipExportSource(path)
+    return DirectoryExportSource(path)
@@ -0,0 +1,281 @@
+import sys
+from array import array
+from typing import NamedTuple
+
+
+class Attachment:
+    """
+    An attachment of a thought from attachments.json.
+    """
+
+    __slots__ = ("location", "name", "type", "source_type", "note_type")
+
+    def __init__(self, location, name, type, source_type, note_type):
+        self.location = location
+        self.name = name
+        self.type = type
+        self.source_type = source_type
+        self.note_type = note_type
+
+    def to_json(self):
+        return {
+            "location": self.location,
+            "name": self.name,
+            "type": self.type,
+            "source_type": self.source_type,
+            "note_type": self.note_type,
+        }
+
+
+class Thought:
+    """
+    A thought, tag or type from thoughts.json. Its links are kept in the LinkTable.
+    tag_name and tag_paths are only set for tags.
+    """
+
+    __slots__ = (
+        "id",
+        "name",
+        "kind",
+        "type_id",
+        "ac_type",
+        "label",
+        "forgotten_date_time",
+        "attachments",
+        "tag_name",
+        "tag_paths",
+    )
+
+    def __init__(
+        self,
+        id,
+        name,
+        kind,
+        type_id="",
+        ac_type=0,
+        label="",
+        forgotten_date_time="",
+        attachments=(),
+    ):
+        self.id = id
+        self.name = name
+        self.kind = kind
+        self.type_id = type_id
+        self.ac_type = ac_type
+        self.label = label
+        self.forgotten_date_time = forgotten_date_time
+        self.attachments = attachments
+        self.tag_name = None
+        self.tag_paths = None
+
+    def to_json(self):
+        """
+        Returns the thought in the format of the nodes_json debug dump, without its links.
+        """
+        return {
+            "ID": self.id,
+            "Name": self.name,
+            "Kind": self.kind,
+            "TypeId": self.type_id,
+            "ACType": self.ac_type,
+            "Label": self.label,
+            "ForgottenDateTime": self.forgotten_date_time,
+            "Attachments": [attachment.to_json() for attachment in self.attachments],
+        }
+
+
+class Link(NamedTuple):
+    """
+    A link from a thought to the thought with ID id, as returned by LinkTable.get.
+    """
+
+    id: str
+    relation: int
+    meaning: int
+    direction: int
+    kind: int
+
+    def to_json(self):
+        return {
+            "ID": self.id,
+            "relation_type": self.relation,
+            "relation_key": self.relation,
+            "meaning_key": self.meaning,
+            "direction_key": self.direction,
+            "kind": self.kind,
+        }
+
+
+class LinkTable:
+    """
+    The links of a brain as array-backed edge lists.
+
+    Every thought ID is interned and numbered once; each link is stored as its source and
+    target numbers and its relation, meaning, direction and kind in typed arrays, a few bytes
+    per link instead of a dict. The first time links are looked up, the links a thought owns
+    (out-edges) and the links to it (in-edges) are indexed in one pass, grouped by thought and
+    LinkRelation (compressed sparse rows), keeping the order in which they were added.
+    """
+
+    def __init__(self):
+        self.node_ids = []
+        self.node_numbers = {}
+        self.sources = array("l")
+        self.targets = array("l")
+        self.relations = array("h")
+        self.meanings = array("h")
+        self.directions = array("h")
+        self.kinds = array("h")
+        self._relation_count = None
+        self._out_offsets = None
+        self._out_edges = None
+        self._in_offsets = None
+        self._in_edges = None
+
+    def __len__(self):
+        return len(self.sources)
+
+    def node_number(self, node_id):
+        """
+        Returns the number of a thought ID, numbering (and interning) it if it is new.
+        """
+        number = self.node_numbers.get(node_id)
+        if number is None:
+            number = len(self.node_ids)
+            node_id = sys.intern(node_id)
+            self.node_ids.append(node_id)
+            self.node_numbers[node_id] = number
+        return number
+
+    def add(self, source_id, target_id, relation, meaning, direction, kind):
+        """
+        Adds a link owned by the thought source_id.
+        """
+        self.sources.append(self.node_number(source_id))
+        self.targets.append(self.node_number(target_id))
+        self.relations.append(relation)
+        self.meanings.append(meaning)
+        self.directions.append(direction)
+        self.kinds.append(kind)
+        self._out_offsets = None
+
+    def _build_index(self):
+        # Rows are keyed by thought number * relation count + relation
+        relation_count = max(self.relations, default=0) + 1
+        row_count = len(self.node_ids) * relation_count
+        itemsize = array("l").itemsize
+        out_offsets = array("l", bytes(itemsize * (row_count + 1)))
+        in_offsets = array("l", bytes(itemsize * (row_count + 1)))
+        for source, target, relation in zip(self.sources, self.targets, self.relations):
+            out_offsets[source * relation_count + relation + 1] += 1
+            in_offsets[target * relation_count + relation + 1] += 1
+        for row in range(row_count):
+            out_offsets[row + 1] += out_offsets[row]
+            in_offsets[row + 1] += in_offsets[row]
+
+        out_positions = array("l", out_offsets)
+        in_positions = array("l", in_offsets)
+        out_edges = array("l", bytes(itemsize * len(self.sources)))
+        in_edges = array("l", bytes(itemsize * len(self.sources)))
+        for edge, (source, target, relation) in enumerate(
+            zip(self.sources, self.targets, self.relations)
+        ):
+            row = source * relation_count + relation
+            out_edges[out_positions[row]] = edge
+            out_positions[row] += 1
+            row = target * relation_count + relation
+            in_edges[in_positions[row]] = edge
+            in_positions[row] += 1
+
+        self._relation_count = relation_count
+        self._out_offsets = out_offsets
+        self._out_edges = out_edges
+        self._in_offsets = in_offsets
+        self._in_edges = in_edges
+
+    def edges(self, node_id, relation=None, incoming=False):
+        """
+        Returns the numbers of the links a thought owns, or with incoming the links to it,
+        in the order they were added. With a relation only the links of that LinkRelation
+        are returned, otherwise the links are grouped by relation.
+        """
+        number = self.node_numbers.get(node_id)
+        if number is None:
+            return ()
+        if self._out_offsets is None:
+            self._build_index()
+        if relation is not None and not 0 <= relation < self._relation_count:
+            return ()
+        offsets, edges = (
+            (self._in_offsets, self._in_edges)
+            if incoming
+            else (self._out_offsets, self._out_edges)
+        )
+        row = number * self._relation_count
+        if relation is None:
+            return edges[offsets[row] : offsets[row + self._relation_count]]
+        return edges[offsets[row + relation] : offsets[row + relation + 1]]
+
+    def link(self, edge, incoming=False):
+        """
+        Returns a link by its number, with the ID of its target, or with incoming the ID
+        of the thought that owns it.
+        """
+        return Link(
+            self.node_ids[self.sources[edge] if incoming else self.targets[edge]],
+            self.relations[edge],
+            self.meanings[edge],
+            self.directions[edge],
+            self.kinds[edge],
+        )
+
+    def get(self, node_id, default=()):
+        """
+        Returns the links owned by a thought in the order they were added, like
+        links_json.get(node_id) did.
+        """
+        edges = self.edges(node_id)
+        if not len(edges):
+            return default
+        return [self.link(edge) for edge in sorted(edges)]
+
+    def to_json(self):
+        """
+        Returns the links in the format of the links_json debug dump:
+        thought ID -> list of its links.
+        """
+        links_json = {}
+        for edge, source in enumerate(self.sources):
+            links_json.setdefault(self.node_ids[source], []).append(
+                self.link(edge).to_json()
+            )
+        return links_json
+
+
+def records_to_json(records, links, fields):
+    """
+    Adapts thoughts, tags or types to the format of the debug JSON dumps.
+
+    Args:
+        records (dict): Thought ID -> Thought.
+        links (LinkTable): The links of the brain.
+        fields (str): "node" for nodes_json, "thought" for thoughts_json (ID and Name only),
+            "tag" for tags_json or "type" for types_json.
+
+    Returns:
+        dict: Thought ID -> dict.
+    """
+    records_json = {}
+    for node_id, thought in records.items():
+        if fields == "node":
+            record_json = thought.to_json()
+        else:
+            record_json = {"ID": thought.id, "Name": thought.name}
+            if fields == "tag":
+                record_json["TagName"] = thought.tag_name
+                if thought.tag_paths is not None:
+                    record_json["TagPaths"] = thought.tag_paths
+        if fields != "thought":
+            record_json["Links"] = [link.to_json() for link in links.get(node_id)]
+        records_json[node_id] = record_json
+    return records_json
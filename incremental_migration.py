@@ -0,0 +1,125 @@
+import os
+import json
+import hashlib
+import unicodedata
+import logging
+from attachment_copier import file_hash, load_manifest, save_manifest
+
+# Increase when the rendered output changes, so every note is rendered again
+FINGERPRINT_VERSION = 4
+
+
+def note_fingerprint(
+    node_data,
+    tags,
+    relations,
+    notes_path,
+    notes_info,
+    body_transforms,
+    verify_hash=False,
+    export_source=None,
+):
+    """
+    Returns a fingerprint of everything the markdown file of a thought is rendered from:
+    the thought record, its tags, attachments and related thoughts (in either link direction),
+    its Notes.md and the body transforms applied to it.
+
+    Args:
+        node_data (Thought): The thought's entry in nodes_json.
+        tags (list): The thought's tag names.
+        relations (list): The thought's (field, name) pairs from related_thoughts.
+        notes_path (str): Path of the thought's Notes.md, or None if there is none.
+        notes_info (dict): The "size" and "mtime_ns" of the Notes.md, or None if there is none.
+        body_transforms (list): The transforms applied to the Notes.md content.
+        verify_hash (bool): Fingerprint Notes.md by its content hash instead of its size and mtime.
+        export_source: The export_source notes_path is from, or None for a file on disk.
+
+    Returns:
+        str: A hex digest.
+    """
+    if notes_info is None:
+        notes_signature = None
+    elif verify_hash:
+        notes_signature = (
+            file_hash(notes_path)
+            if export_source is None
+            else export_source.file_hash(notes_path)
+        )
+    else:
+        notes_signature = [notes_info["size"], notes_info["mtime_ns"]]
+
+    fingerprint_data = [
+        FINGERPRINT_VERSION,
+        node_data.to_json(),
+        tags,
+        relations,
+        notes_signature,
+        [body_transform.name for body_transform in body_transforms],
+    ]
+    return hashlib.blake2b(
+        json.dumps(fingerprint_data, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+
+
+def load_notes_state(notes_state_path):
+    """
+    Loads the state of the notes written by the previous run: thought ID -> {"file", "fingerprint"}.
+    """
+    return load_manifest(notes_state_path)
+
+
+def save_notes_state(notes_state, notes_state_path):
+    """
+    Saves the state of the notes written by this run.
+    """
+    save_manifest(notes_state, notes_state_path)
+
+
+def _file_key(file_name):
+    """
+    Returns the key of a file name for case-insensitive filesystems, as
+    util.UniqueNameAllocator does for case_insensitive names.
+    """
+    return unicodedata.normalize("NFC", file_name).casefold()
+
+
+def delete_removed_notes(previous_state, notes_state, output_dir):
+    """
+    Deletes the markdown files of the previous run that no thought writes any more,
+    e.g. for thoughts that were deleted, forgotten or renamed in The Brain.
+
+    A file whose name only differs by case or Unicode normalization from a current file
+    ("Foo.md" -> "foo.md") is not deleted if it is that file, as on case-insensitive
+    filesystems (Windows, macOS) the current note was just written into it.
+
+    Returns:
+        int: The number of files deleted.
+    """
+    current_files = {entry["file"] for entry in notes_state.values()}
+    current_files_by_key = {}
+    for file_name in current_files:
+        current_files_by_key.setdefault(_file_key(file_name), []).append(file_name)
+    files_deleted = 0
+    for node_id, entry in previous_state.items():
+        if entry["file"] in current_files:
+            continue
+        file_path = os.path.join(output_dir, entry["file"])
+        try:
+            if os.path.exists(file_path) and not any(
+                os.path.exists(current_path)
+                and os.path.samefile(file_path, current_path)
+                for current_path in (
+                    os.path.join(output_dir, file_name)
+                    for file_name in current_files_by_key.get(
+                        _file_key(entry["file"]), ()
+                    )
+                )
+            ):
+                os.remove(file_path)
+                files_deleted += 1
+                logging.info(
+                    f"Deleted markdown file of removed thought {node_id}: {file_path}"
+                )
+        except Exception as e:
+            logging.error(f"Failed to delete markdown file {file_path}. Error: {e}")
+    return files_deleted
@@ -0,0 +1,267 @@
+import os
+import json
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from TheBrainConstants import ThoughtKind
+from attachment_copier import file_hash
+import vault_link_index as link_idx
+
+
+def count_export(export_index, nodes_json):
+    """
+    Counts what the export contains from the parsed thoughts and the export directory index.
+
+    Args:
+        export_index (dict): The index from util.scan_export_directory.
+        nodes_json (dict): All thoughts, tags and types by ID (graph_model.Thought),
+            or the migration_store.MigrationStore they are stored in.
+
+    Returns:
+        dict: The number of thoughts (not forgotten), forgotten thoughts, tags, types,
+            Notes.md files, attachments, md-images, attachment folders and the files in them.
+    """
+    counts = {
+        "thoughts": 0,
+        "forgotten_thoughts": 0,
+        "tags": 0,
+        "types": 0,
+        "notes_md": 0,
+        "attachments": 0,
+        "md_images": 0,
+        "folders": 0,
+        "folder_files": 0,
+    }
+    for node_data in nodes_json.values():
+        if node_data.kind == ThoughtKind.TAG:
+            counts["tags"] += 1
+        elif node_data.kind == ThoughtKind.TYPE:
+            counts["types"] += 1
+        elif node_data.kind == ThoughtKind.THOUGHT:
+            if node_data.forgotten_date_time:
+                counts["forgotten_thoughts"] += 1
+            else:
+                counts["thoughts"] += 1
+
+    for folder_index in export_index.values():
+        counts["notes_md"] += folder_index["notes"] is not None
+        counts["attachments"] += len(folder_index["files"])
+        counts["md_images"] += len(folder_index["md_images"])
+        counts["folders"] += len(folder_index["folders"])
+        counts["folder_files"] += sum(
+            len(sub_files) for _, _, _, sub_files in folder_index["folders"]
+        )
+    return counts
+
+
+def check_attachments(export_counts, copy_jobs, copy_summary, destination_directories):
+    """
+    Compares the attachments in the export with the files copied to the vault, using the
+    copy jobs and the copy summary rather than walking the vault.
+
+    Files in the export with the same destination (e.g. two thoughts with an attachment of
+    the same name) are reported as collisions, as only one of them arrives in the vault.
+
+    Args:
+        export_counts (dict): The counts from count_export.
+        copy_jobs (dict): Destination file path -> source file path.
+        copy_summary (dict): The summary of attachment_copier.copy_files or sync_files.
+        destination_directories (dict): "attachments", "md_images" and "folder_files"
+            -> the vault directory they are copied to.
+
+    Returns:
+        dict: For each kind, the number of files expected, copied and colliding, and the
+            destination paths of the files that failed to copy.
+    """
+    failed_files = set(copy_summary.get("failed_files", []))
+    checks = {}
+    for kind, directory in destination_directories.items():
+        prefix = os.path.join(os.path.normpath(directory), "")
+        destinations = [
+            destination_path
+            for destination_path in copy_jobs
+            if os.path.normpath(destination_path).startswith(prefix)
+        ]
+        failed = sorted(
+            destination_path
+            for destination_path in destinations
+            if destination_path in failed_files
+        )
+        checks[kind] = {
+            "expected": export_counts[kind],
+            "copied": len(destinations) - len(failed),
+            "collisions": export_counts[kind] - len(destinations),
+            "failed": failed,
+        }
+        checks[kind]["ok"] = checks[kind]["copied"] == checks[kind]["expected"]
+    return checks
+
+
+def check_notes(export_counts, markdown_summary, output_dir, link_index_path=None):
+    """
+    Compares the thoughts in the export with the markdown files in the vault, using the
+    outcomes of generate_markdown_files and the vault link index rather than walking the vault.
+    Without a link index each note file is checked on its own.
+
+    Returns:
+        dict: The number of notes expected and present, the notes that failed or are missing,
+            and the number of file names that only differ by case, which overwrite each other
+            on case-insensitive filesystems.
+    """
+    files = markdown_summary["files"]
+    failed = sorted(
+        file_name for file_name, outcome in files.items() if outcome == "failed"
+    )
+    if link_index_path and os.path.exists(link_index_path):
+        link_index = link_idx.load_link_index(link_index_path)
+        missing = sorted(
+            file_name
+            for file_name, outcome in files.items()
+            if outcome != "failed" and file_name not in link_index
+        )
+    else:
+        missing = sorted(
+            file_name
+            for file_name, outcome in files.items()
+            if outcome != "failed"
+            and not os.path.exists(os.path.join(output_dir, file_name))
+        )
+    checks = {
+        "expected": export_counts["thoughts"],
+        "present": len(files) - len(failed) - len(missing),
+        "failed": failed,
+        "missing": missing,
+        "case_insensitive_duplicates": len(files)
+        - len({file_name.casefold() for file_name in files}),
+    }
+    checks["ok"] = checks["present"] == checks["expected"]
+    return checks
+
+
+def verify_checksums(copy_jobs, failed_files=(), max_workers=8, export_source=None):
+    """
+    Verifies that the content of each copied file matches its source, checking files
+    concurrently. Hardlinks to the source are not read, and files of a different size
+    are not hashed. Sources are read from export_source (e.g. a zip archive) if given.
+
+    Returns:
+        dict: The number of files verified, the destination paths of the files that differ
+            from their source and the elapsed seconds.
+    """
+    failed_files = set(failed_files)
+
+    def verify_job(job):
+        destination_path, source_path = job
+        try:
+            if export_source is None:
+                if os.path.samefile(source_path, destination_path):
+                    return True
+                source_size = os.path.getsize(source_path)
+            else:
+                if export_source.is_same_file(source_path, destination_path):
+                    return True
+                source_size = export_source.stat(source_path)[0]
+            if source_size != os.path.getsize(destination_path):
+                return False
+            source_hash = (
+                file_hash(source_path)
+                if export_source is None
+                else export_source.file_hash(source_path)
+            )
+            return source_hash == file_hash(destination_path)
+        except Exception as e:
+            logging.error(f"Failed to verify {destination_path}. Error: {e}")
+            return False
+
+    jobs = [job for job in copy_jobs.items() if job[0] not in failed_files]
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        results = list(executor.map(verify_job, jobs))
+
+    return {
+        "verified": len(jobs),
+        "mismatched": sorted(
+            destination_path
+            for (destination_path, _), matches in zip(jobs, results)
+            if not matches
+        ),
+        "seconds": time.perf_counter() - start_time,
+    }
+
+
+def verify_migration(
+    export_index,
+    nodes_json,
+    copy_jobs,
+    copy_summary,
+    destination_directories,
+    markdown_summary,
+    output_dir,
+    link_index_path=None,
+    checksums=False,
+    max_workers=8,
+    export_source=None,
+):
+    """
+    Checks that everything in the export arrived in the vault: counts the thoughts, tags,
+    attachments, md-images and folders in the export and compares them with what was written,
+    optionally verifying the content of the copied files with checksums.
+
+    Returns:
+        dict: The report, with "ok" False if any check failed.
+    """
+    start_time = time.perf_counter()
+    export_counts = count_export(export_index, nodes_json)
+    report = {
+        "export": export_counts,
+        "notes": check_notes(
+            export_counts, markdown_summary, output_dir, link_index_path
+        ),
+        "attachments": check_attachments(
+            export_counts, copy_jobs, copy_summary, destination_directories
+        ),
+    }
+    report["ok"] = report["notes"]["ok"] and all(
+        check["ok"] for check in report["attachments"].values()
+    )
+    if checksums:
+        report["checksums"] = verify_checksums(
+            copy_jobs, copy_summary.get("failed_files", []), max_workers, export_source
+        )
+        report["ok"] = report["ok"] and not report["checksums"]["mismatched"]
+    report["seconds"] = time.perf_counter() - start_time
+    return report
+
+
+def save_report(report, report_path):
+    """
+    Saves the integrity report as JSON and logs and prints a summary of it.
+    """
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=4, ensure_ascii=False)
+
+    notes = report["notes"]
+    messages = [
+        f"Notes: {notes['present']} of {notes['expected']} thoughts, "
+        f"{len(notes['failed'])} failed, {len(notes['missing'])} missing"
+    ]
+    for kind, check in report["attachments"].items():
+        messages.append(
+            f"{kind}: {check['copied']} of {check['expected']} copied, "
+            f"{check['collisions']} name collisions, {len(check['failed'])} failed"
+        )
+    if "checksums" in report:
+        messages.append(
+            f"Checksums: {report['checksums']['verified']} files verified, "
+            f"{len(report['checksums']['mismatched'])} differ from the export"
+        )
+    messages.append(
+        f"Integrity check {'passed' if report['ok'] else 'FAILED'} in "
+        f"{report['seconds']:.2f}s, report written to: {report_path}"
+    )
+    for message in messages:
+        if report["ok"]:
+            logging.info(message)
+        else:
+            logging.warning(message)
+        print(message)
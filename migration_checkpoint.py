@@ -0,0 +1,153 @@
+import os
+import json
+import logging
+import threading
+
+# Increase when the journal format changes, so older journals are not resumed
+JOURNAL_VERSION = 1
+# Records written between syncs of the journal to disk
+fsync_interval = 1000
+
+
+def journal_header(export_source, file_names, settings):
+    """
+    Returns the header of a progress journal: the export it was written for, the size and
+    mtime of the export's JSON files, and the settings of the migration. A journal is only
+    resumed by a run with the same header.
+
+    Args:
+        export_source: The export_source of the migration.
+        file_names (list): The JSON files of the export, e.g. thoughts.json.
+        settings (dict): The settings of enduser_config.
+    """
+    files = {}
+    for file_name in file_names:
+        try:
+            files[file_name] = list(
+                export_source.stat(export_source.file_path(file_name))
+            )
+        except Exception as e:
+            logging.error(f"Failed to read {file_name} for the checkpoint. Error: {e}")
+            files[file_name] = None
+    header = {
+        "version": JOURNAL_VERSION,
+        "export": os.path.abspath(export_source.path),
+        "files": files,
+        "settings": settings,
+    }
+    # As it reads back from the journal, e.g. tuples as lists
+    return json.loads(json.dumps(header))
+
+
+def load_journal(journal_path, header):
+    """
+    Loads the items completed by an interrupted migration from its progress journal.
+
+    Returns:
+        dict: Stage -> {key: entry} of the completed items, or None if there is no journal
+            or it was written for another export or other settings.
+    """
+    if not os.path.exists(journal_path):
+        return None
+    completed = {}
+    try:
+        with open(journal_path, "r", encoding="utf-8") as f:
+            first_line = f.readline()
+            if not first_line or json.loads(first_line) != header:
+                logging.warning(
+                    f"Checkpoint {journal_path} is for another export or other settings"
+                )
+                return None
+            for line in f:
+                try:
+                    stage, key, entry = json.loads(line)
+                except ValueError:
+                    # The last line of a journal that was interrupted while writing it
+                    logging.warning(f"Ignored an incomplete line of {journal_path}")
+                    continue
+                completed.setdefault(stage, {})[key] = entry
+    except Exception as e:
+        logging.error(f"Failed to read checkpoint {journal_path}. Error: {e}")
+        return None
+    return completed
+
+
+class ProgressJournal:
+    """
+    A durable journal of the work completed by a migration, so an interrupted migration can be
+    resumed (thebrain2markdown.py --resume) without redoing it.
+
+    The journal is a file of JSON lines: the header from journal_header, then a
+    [stage, key, entry] line per completed item, e.g. an attachment by its destination path
+    or a note by its thought ID. Each line is flushed as it is recorded and the file is synced
+    to disk every fsync_interval lines, so a failed run loses at most the items in progress.
+    Items may be recorded from several threads at once.
+    """
+
+    def __init__(self, journal_path, header, completed=None):
+        """
+        Starts a new journal at journal_path, or with the completed items from load_journal
+        continues the journal of an interrupted migration.
+        """
+        self.path = journal_path
+        self._completed = completed if completed is not None else {}
+        self._lock = threading.Lock()
+        self._unsynced = 0
+        os.makedirs(os.path.dirname(journal_path) or ".", exist_ok=True)
+        if completed is not None:
+            self._file = open(journal_path, "a", encoding="utf-8")
+        else:
+            self._file = open(journal_path, "w", encoding="utf-8")
+            self._write(header)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _write(self, data):
+        self._file.write(json.dumps(data, ensure_ascii=False))
+        self._file.write("\n")
+        self._file.flush()
+        self._unsynced += 1
+        if self._unsynced >= fsync_interval:
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+
+    def completed(self, stage):
+        """
+        Returns the items of a stage completed by the interrupted migration: key -> entry.
+        """
+        return self._completed.get(stage, {})
+
+    def record(self, stage, key, entry=None):
+        """
+        Records an item as completed. A failure to record it is logged, the item is then
+        done again if the migration is resumed.
+        """
+        with self._lock:
+            try:
+                self._write([stage, key, entry])
+            except Exception as e:
+                logging.error(
+                    f"Failed to record {stage} {key} in the checkpoint. Error: {e}"
+                )
+
+    def close(self):
+        with self._lock:
+            if self._file.closed:
+                return
+            try:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            finally:
+                self._file.close()
+
+    def remove(self):
+        """
+        Closes and deletes the journal once the migration it records has finished.
+        """
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -1,108 +1,282 @@
-import os
-import json
-from shutil import copyfile
+import re
+import yaml
+from dataclasses import dataclass
 from TheBrainConstants import ThoughtKind, LinkKind, LinkMeaning
 import enduser_config as config
 
+# Dumper for frontmatter the fast emitter does not handle. The pure-Python dumper is used
+# as libyaml (CSafeDumper) folds some long quoted strings differently from yaml.dump
+FrontmatterDumper = yaml.SafeDumper
 
-def convert_types_to_tags(thoughts_file, links_file, backup_folder):
+
+# Strings that PyYAML writes either plain or in single quotes, without escapes or line wrapping:
+# printable ASCII words without YAML indicators, separated by single spaces
+simple_frontmatter_string_pattern = re.compile(
+    r"[A-Za-z0-9_][\w./-]*(?: [\w./-]+)*", re.ASCII
+)
+# The resolver PyYAML uses to decide whether a plain string would be read back as another type
+frontmatter_resolver = yaml.resolver.Resolver()
+
+
+def _frontmatter_scalar(value):
     """
-    Converts objects in TB_Refactored_thoughts.json and TB_Refactored_links.json based on the specified rules:
-    1. Converts thoughts with ThoughtKind = TYPE to ThoughtKind = TAG and prepends "TYPE_" to their "Name".
-    2. Converts links with LinkMeaning = TYPE_TO_THOUGHT to LinkMeaning = TAG_TO_THOUGHT and changes LinkKind to LINK_TYPE.
-    3. Converts links with LinkMeaning = TYPE_TO_TYPE to LinkMeaning = TAG_TO_TAG and changes LinkKind to LINK_TYPE.
+    Returns value formatted as yaml.dump would write it, or None if it is not a simple string.
+    """
+    if not isinstance(value, str):
+        return None
+    if value == "":
+        return "''"
+    # Longer strings with spaces may be wrapped by PyYAML at 80 characters
+    if len(value) > 70 and " " in value:
+        return None
+    if not simple_frontmatter_string_pattern.fullmatch(value):
+        return None
+    # Strings that look like booleans, numbers, dates, ... are quoted
+    if (
+        frontmatter_resolver.resolve(yaml.ScalarNode, value, (True, False))
+        == "tag:yaml.org,2002:str"
+    ):
+        return value
+    return f"'{value}'"
+
 
-    Saves the original JSON files to a folder called "Original Refactored JSONS" and saves the amended files back to their original locations.
+def render_frontmatter(yaml_data):
     """
+    Serializes the YAML frontmatter of a note (tags, publish, exTheBrain, aliases) with the same
+    output as yaml.dump(yaml_data, default_flow_style=False), without PyYAML's slow pure-Python
+    emitter. Values other than simple strings and non-empty lists of simple strings are dumped
+    with yaml.dump, which is rare.
 
-    # Ensure backup folder exists
-    os.makedirs(backup_folder, exist_ok=True)
+    Args:
+        yaml_data (dict): The frontmatter, with string keys.
 
-    # Backup original files
-    copyfile(thoughts_file, os.path.join(backup_folder, "TB_Refactored_thoughts.json"))
-    copyfile(links_file, os.path.join(backup_folder, "TB_Refactored_links.json"))
+    Returns:
+        str: The YAML text, without the "---" delimiters.
+    """
+    lines = []
+    for key in sorted(yaml_data):
+        value = yaml_data[key]
+        if isinstance(value, list):
+            items = [_frontmatter_scalar(item) for item in value]
+            if not items or None in items:
+                break
+            lines.append(f"{key}:\n")
+            lines.extend(f"- {item}\n" for item in items)
+        else:
+            scalar = _frontmatter_scalar(value)
+            if scalar is None:
+                break
+            lines.append(f"{key}: {scalar}\n")
+    else:
+        return "".join(lines)
+
+    return yaml.dump(yaml_data, Dumper=FrontmatterDumper, default_flow_style=False)
 
-    # Load JSON data
-    with open(thoughts_file, "r", encoding="utf-8") as f:
-        thoughts_data = json.load(f)
 
-    with open(links_file, "r", encoding="utf-8") as f:
-        links_data = json.load(f)
+def convert_type_thoughts_to_tags(thought_records):
+    """
+    Converts thought records as they are streamed from thoughts.json:
+    Thoughts with ThoughtKind = TYPE become ThoughtKind = TAG and have types_prepend_text
+    prepended to their "Name". All other records are passed through unchanged.
+
+    Args:
+        thought_records (iterable): Thought records, e.g. from util.iter_TBjson_records.
 
-    # Process thoughts
-    for thought in thoughts_data:
+    Yields:
+        dict: The (converted) thought records.
+    """
+    for thought in thought_records:
         if thought.get("Kind") == ThoughtKind.TYPE:
             thought["Kind"] = ThoughtKind.TAG
             if "Name" in thought:
                 thought["Name"] = f"{config.types_prepend_text}{thought['Name']}"
+        yield thought
+
+
+def convert_type_links_to_tags(link_records):
+    """
+    Converts link records as they are streamed from links.json:
+    1. Links with LinkMeaning = TYPE_TO_THOUGHT become LinkMeaning = TAG_TO_THOUGHT with LinkKind = LINK_TYPE.
+    2. Links with LinkMeaning = TYPE_TO_TYPE become LinkMeaning = TAGS_TO_TAGS with LinkKind = LINK_TYPE.
+    All other records are passed through unchanged.
 
-    # Process links
-    for link in links_data:
+    Args:
+        link_records (iterable): Link records, e.g. from util.iter_TBjson_records.
+
+    Yields:
+        dict: The (converted) link records.
+    """
+    for link in link_records:
         if link.get("Meaning") == LinkMeaning.TYPE_TO_THOUGHT:
             link["Meaning"] = LinkMeaning.TAG_TO_THOUGHT
             link["Kind"] = LinkKind.LINK_TYPE
         elif link.get("Meaning") == LinkMeaning.TYPE_TO_TYPE:
             link["Meaning"] = LinkMeaning.TAGS_TO_TAGS
             link["Kind"] = LinkKind.LINK_TYPE
+        yield link
+
+
+# Replace [****](brain://****) with [[****]]
+brain_link_pattern = re.compile(r"\[([^\]]+)\]\(brain://[^\)]+\)")
+# Replace local image references with ![[filename|200]]
+md_image_link_pattern = re.compile(
+    r"!\[.*?\]\(\.data/md-images/([^/]+\.(?:png|jpg|jpeg|gif|bmp|tiff|svg))(?:#.*)?\)"
+)
+
+
+def convert_brain_links(notes_content):
+    """
+    Converts links to other thoughts, [name](brain://...), to Obsidian links [[name]].
+    """
+    return brain_link_pattern.sub(r"[[\1]]", notes_content)
+
+
+def convert_md_image_links(notes_content):
+    """
+    Converts embedded images, ![...](.data/md-images/file.png), to Obsidian embeds ![[file.png|200]]
+    on a new line.
+    """
+    return md_image_link_pattern.sub(r"\n![[\1|200]]", notes_content)
+
+
+def convert_check_box_lines(lines, inside_yaml=False):
+    """
+    Replaces checkboxes in a list of lines:
+    - Lines starting with '+' with '- [x]'
+    - Lines starting with '-' with '- [ ]'
+    Lines between '---' markers are treated as YAML frontmatter and left unchanged.
+
+    Args:
+        lines (list): The lines to process, with or without line endings.
+        inside_yaml (bool): Whether the first line is inside YAML frontmatter.
+
+    Returns:
+        tuple: The updated lines and whether any line was changed.
+    """
+    modified = False
+    updated_lines = []
+
+    for line in lines:
+        # Detect YAML frontmatter boundaries
+        if line.strip() == "---":
+            inside_yaml = not inside_yaml
+            updated_lines.append(line)
+            continue
+
+        # Only process lines outside the YAML frontmatter
+        if not inside_yaml:
+            if line.startswith("+"):
+                updated_lines.append(line.replace("+", "- [x]", 1))
+                modified = True
+            elif line.startswith("-"):
+                updated_lines.append(line.replace("-", "- [ ]", 1))
+                modified = True
+            else:
+                updated_lines.append(line)
+        else:
+            updated_lines.append(line)
+
+    return updated_lines, modified
+
+
+def convert_check_boxes(notes_content):
+    """
+    Converts the checkboxes in the content of a note (see convert_check_box_lines).
+    The content must not include the note's YAML frontmatter.
+    """
+    if "+" not in notes_content and "-" not in notes_content:
+        return notes_content
+    updated_lines, modified = convert_check_box_lines(notes_content.split("\n"))
+    return "\n".join(updated_lines) if modified else notes_content
+
+
+# Replace [[YYYY MM DD]] with [[YYYY-MM-DD]] (see date_link_wrangler.py)
+date_link_pattern = re.compile(r"\[\[(\d{4}) (\d{2}) (\d{2})\]\]")
+# Replace "[ ]" at the start of a line with "- [ ]" (see Square_brack_to_Checkbox.py)
+square_bracket_check_box_pattern = re.compile(r"^\[ \]", re.MULTILINE)
+
+
+def convert_date_links(notes_content):
+    """
+    Converts date links [[YYYY MM DD]] to ISO 8601 date links [[YYYY-MM-DD]].
+    """
+    return date_link_pattern.sub(r"[[\1-\2-\3]]", notes_content)
+
+
+def convert_square_bracket_check_boxes(notes_content):
+    """
+    Converts lines starting with "[ ]" to Obsidian checkboxes "- [ ]".
+    """
+    return square_bracket_check_box_pattern.sub("- [ ]", notes_content)
+
+
+@dataclass(frozen=True)
+class BodyTransform:
+    """
+    A named rewrite of the content of a note. The rewrite is only run on content that contains
+    at least one of the required substrings (or on all content if there are none), and that
+    matches the required pattern if there is one, so notes without anything to rewrite skip
+    the regular expressions entirely.
+    """
+
+    name: str
+    rewrite: object
+    required_substrings: tuple = ()
+    required_pattern: object = None
+
+    def __call__(self, notes_content):
+        if self.required_substrings and not any(
+            substring in notes_content for substring in self.required_substrings
+        ):
+            return notes_content
+        if self.required_pattern is not None and not self.required_pattern.search(
+            notes_content
+        ):
+            return notes_content
+        return self.rewrite(notes_content)
+
+
+# Registered body transforms by name, in the order they are applied
+body_transforms = {}
+
+
+def register_body_transform(
+    name, rewrite, required_substrings=(), required_pattern=None
+):
+    """
+    Registers a rewrite of note content under a name, see BodyTransform.
+    Transforms are applied in the order they are registered.
+    """
+    body_transforms[name] = BodyTransform(
+        name, rewrite, tuple(required_substrings), required_pattern
+    )
+
+
+def get_body_transforms(names):
+    """
+    Returns the registered body transforms with the given names, in registration order.
+
+    Raises:
+        ValueError: If a name is not registered.
+    """
+    unknown_names = set(names) - body_transforms.keys()
+    if unknown_names:
+        raise ValueError(
+            f"Unknown body transforms {sorted(unknown_names)}, available: {list(body_transforms)}"
+        )
+    return [transform for name, transform in body_transforms.items() if name in names]
+
+
+register_body_transform("brain_links", convert_brain_links, ["brain://"])
+# Most notes contain "[[" once brain_links has run, only dated links start with 4 digits
+register_body_transform(
+    "date_links", convert_date_links, ["[["], re.compile(r"\[\[\d{4} ")
+)
+register_body_transform("md_image_links", convert_md_image_links, [".data/md-images"])
+register_body_transform("check_boxes", convert_check_boxes, ["+", "-"])
+register_body_transform(
+    "square_bracket_check_boxes", convert_square_bracket_check_boxes, ["[ ]"]
+)
 
-    # Save updated JSON data back to the original files
-    with open(thoughts_file, "w", encoding="utf-8") as f:
-        json.dump(thoughts_data, f, indent=4, ensure_ascii=False)
-
-    with open(links_file, "w", encoding="utf-8") as f:
-        json.dump(links_data, f, indent=4, ensure_ascii=False)
-
-    print("Conversion completed. Original files have been backed up.")
-
-
-def refactor_check_boxes(dir_location_of_obsidian_vault):
-    """
-    Goes through all .md files in the specified folder and replaces:
-    - Lines starting with '+' with '[x]'
-    - Lines starting with '-' with '[ ]'
-    Only processes content below the YAML frontmatter (enclosed by '---').
-    Logs the files that were amended.
-    """
-    print(f"Refactoring checkboxes in: {dir_location_of_obsidian_vault}")
-    for root, _, files in os.walk(dir_location_of_obsidian_vault):
-        for file in files:
-            if file.endswith(".md"):  # Process only .md files
-                file_path = os.path.join(root, file)
-                try:
-                    with open(file_path, "r", encoding="utf-8") as f:
-                        lines = f.readlines()
-
-                    modified = False
-                    updated_lines = []
-                    inside_yaml = (
-                        False  # Track whether we are inside the YAML frontmatter
-                    )
-
-                    for line in lines:
-                        # Detect YAML frontmatter boundaries
-                        if line.strip() == "---":
-                            inside_yaml = not inside_yaml
-                            updated_lines.append(line)
-                            continue
-
-                        # Only process lines outside the YAML frontmatter
-                        if not inside_yaml:
-                            if line.startswith("+"):
-                                updated_lines.append(line.replace("+", "- [x]", 1))
-                                modified = True
-                            elif line.startswith("-"):
-                                updated_lines.append(line.replace("-", "- [ ]", 1))
-                                modified = True
-                            else:
-                                updated_lines.append(line)
-                        else:
-                            updated_lines.append(line)
-
-                    if modified:
-                        with open(file_path, "w", encoding="utf-8") as f:
-                            f.writelines(updated_lines)
-                            print(f"Amended file, checkboxes in: {file_path}")
-
-                except Exception as e:
-                    print(f"Error processing file {file_path}: {e}")
-    print(f"Refactored checkboxes in: {dir_location_of_obsidian_vault}")
+# Body transforms always applied during a migration, the others are optional
+default_body_transform_names = ["brain_links", "md_image_links", "check_boxes"]
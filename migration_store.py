@@ -0,0 +1,433 @@
+import os
+import json
+import sqlite3
+import logging
+from itertools import islice
+from collections import OrderedDict
+from TheBrainConstants import ThoughtKind, LinkMeaning
+from graph_model import Attachment, Thought, LinkTable
+import utility as util
+
+# Rows written per executemany and thoughts rendered per batch
+insert_batch_size = 10000
+render_batch_size = 1000
+# Most recently used names StoreNameAllocator keeps in memory
+name_cache_size = 100000
+# Maximum number of parameters in one query, below SQLite's lowest default limit (999)
+query_parameter_limit = 500
+
+schema = """
+CREATE TABLE thoughts (
+    id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    kind INTEGER NOT NULL,
+    type_id TEXT,
+    ac_type INTEGER,
+    label TEXT,
+    forgotten_date_time TEXT,
+    tag_name TEXT,
+    tag_paths TEXT
+);
+CREATE TABLE links (
+    source TEXT NOT NULL,
+    target TEXT NOT NULL,
+    relation INTEGER,
+    meaning INTEGER,
+    direction INTEGER,
+    kind INTEGER
+);
+CREATE TABLE attachments (
+    source_id TEXT NOT NULL,
+    location TEXT,
+    name TEXT,
+    type INTEGER,
+    source_type INTEGER,
+    note_type INTEGER
+);
+CREATE TABLE names (key TEXT PRIMARY KEY) WITHOUT ROWID;
+"""
+
+# Created once the records are loaded, which is faster than updating them on every insert
+indexes = """
+CREATE INDEX IF NOT EXISTS thoughts_id ON thoughts (id);
+CREATE INDEX IF NOT EXISTS thoughts_name ON thoughts (name);
+CREATE INDEX IF NOT EXISTS links_source ON links (source, meaning);
+CREATE INDEX IF NOT EXISTS links_target ON links (target, meaning);
+CREATE INDEX IF NOT EXISTS attachments_source_id ON attachments (source_id);
+"""
+
+
+def _chunks(items, size):
+    iterator = iter(items)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+class MigrationStore:
+    """
+    An on-disk SQLite store of the parsed brain, for brains too large to keep in memory.
+
+    Thoughts, links, attachments and the resolved tag names and paths are written to SQLite
+    as they are streamed from the export, and the render stage reads them back in batches of
+    thoughts (iter_render_batches), each with only the tags, links and names its notes need.
+    The memory used for the parsed graph then depends on the batch size, not on the size of
+    the brain. The per-note records of a run (the outcome of each file, the notes state, the
+    vault link index) and the export index and copy jobs still grow with the brain.
+
+    The store is rebuilt on every run, unless an interrupted migration is resumed (see
+    migration_checkpoint), and replaces the debug JSON dumps: it can be queried
+    with any SQLite client, e.g.
+    `SELECT name FROM thoughts WHERE id IN (SELECT target FROM links WHERE source = ?)`.
+    """
+
+    def __init__(self, path, create=False):
+        self.path = path
+        if create:
+            for file_path in (path, f"{path}-journal", f"{path}-wal", f"{path}-shm"):
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        # The store is rebuilt from the export if a run fails, so it is written without
+        # a journal, and its page cache is limited to 64 MB
+        self.connection.execute("PRAGMA journal_mode = OFF")
+        self.connection.execute("PRAGMA synchronous = OFF")
+        self.connection.execute("PRAGMA cache_size = -65536")
+        if create:
+            self.connection.executescript(schema)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+
+    def add_links(self, link_records):
+        """
+        Stores link records in the order they are read, skipping the links with the
+        meaning NOTTHING as create_links_json_dic does.
+
+        Returns:
+            int: The number of links stored.
+        """
+        count = 0
+        rows = (
+            (
+                item["ThoughtIdA"],
+                item["ThoughtIdB"],
+                item["Relation"],
+                item["Meaning"],
+                item["Direction"],
+                item["Kind"],
+            )
+            for item in link_records
+            if item["Meaning"] != LinkMeaning.NOTTHING
+        )
+        for chunk in _chunks(rows, insert_batch_size):
+            self.connection.executemany(
+                "INSERT INTO links VALUES (?, ?, ?, ?, ?, ?)", chunk
+            )
+            count += len(chunk)
+        self.connection.commit()
+        return count
+
+    def add_attachments(self, attachment_records):
+        """
+        Stores attachment records in the order they are read.
+
+        Returns:
+            int: The number of attachments stored.
+        """
+        count = 0
+        rows = (
+            (
+                item["SourceId"],
+                item["Location"],
+                item["Name"],
+                item["Type"],
+                item["SourceType"],
+                item["NoteType"],
+            )
+            for item in attachment_records
+        )
+        for chunk in _chunks(rows, insert_batch_size):
+            self.connection.executemany(
+                "INSERT INTO attachments VALUES (?, ?, ?, ?, ?, ?)", chunk
+            )
+            count += len(chunk)
+        self.connection.commit()
+        return count
+
+    def add_thoughts(self, thoughts):
+        """
+        Stores Thought records (see thebrain2markdown.iter_thoughts) in the order they
+        are read, and then indexes all tables.
+
+        Returns:
+            int: The number of thoughts, tags and types stored.
+        """
+        count = 0
+        rows = (
+            (
+                node.id,
+                node.name,
+                node.kind,
+                node.type_id,
+                node.ac_type,
+                node.label,
+                node.forgotten_date_time,
+                node.tag_name,
+                None,
+            )
+            for node in thoughts
+        )
+        for chunk in _chunks(rows, insert_batch_size):
+            self.connection.executemany(
+                "INSERT INTO thoughts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", chunk
+            )
+            count += len(chunk)
+        self.connection.executescript(indexes)
+        self.connection.commit()
+        return count
+
+    def _thought(self, row):
+        node = Thought(*row[:7])
+        node.tag_name = row[7]
+        node.tag_paths = json.loads(row[8]) if row[8] is not None else None
+        return node
+
+    def values(self):
+        """
+        Yields every thought, tag and type in the order they were read, like
+        nodes_json.values() (without attachments).
+        """
+        cursor = self.connection.execute(
+            "SELECT id, name, kind, type_id, ac_type, label, forgotten_date_time, "
+            "tag_name, tag_paths FROM thoughts ORDER BY rowid"
+        )
+        for row in cursor:
+            yield self._thought(row)
+
+    def tags(self):
+        """
+        Returns the tags by ID in the order they were read, like list_of_tags.
+        """
+        return {
+            node.id: node
+            for node in (
+                self._thought(row)
+                for row in self.connection.execute(
+                    "SELECT id, name, kind, type_id, ac_type, label, "
+                    "forgotten_date_time, tag_name, tag_paths FROM thoughts "
+                    "WHERE kind = ? ORDER BY rowid",
+                    (ThoughtKind.TAG,),
+                )
+            )
+        }
+
+    def tag_links(self):
+        """
+        Returns a LinkTable of the links owned by tags, e.g. to resolve the tag paths.
+        """
+        links = LinkTable()
+        cursor = self.connection.execute(
+            "SELECT source, target, relation, meaning, direction, kind FROM links "
+            "WHERE source IN (SELECT id FROM thoughts WHERE kind = ?) ORDER BY rowid",
+            (ThoughtKind.TAG,),
+        )
+        for row in cursor:
+            links.add(*row)
+        return links
+
+    def save_tags(self, list_of_tags):
+        """
+        Stores the resolved tag names and paths of the tags.
+        """
+        self.connection.executemany(
+            "UPDATE thoughts SET tag_name = ?, tag_paths = ? WHERE id = ?",
+            (
+                (
+                    node.tag_name,
+                    json.dumps(node.tag_paths) if node.tag_paths is not None else None,
+                    node_id,
+                )
+                for node_id, node in list_of_tags.items()
+            ),
+        )
+        self.connection.commit()
+
+    def _query_by_ids(self, query, ids, *parameters):
+        """
+        Runs a query with an "IN ({ids})" placeholder for chunks of ids, followed by
+        the other parameters.
+        """
+        for chunk in _chunks(ids, query_parameter_limit):
+            yield from self.connection.execute(
+                query.format(ids=", ".join("?" * len(chunk))), [*chunk, *parameters]
+            )
+
+    def iter_render_batches(self, batch_size=render_batch_size):
+        """
+        Yields the thoughts, tags and types in the order they were read, in batches with
+        the indexes their notes are rendered from.
+
+        Yields:
+            tuple: A list of (node ID, Thought) with its attachments, and the
+                (thought_tags, links_json, thought_names) of the batch: the tag names of
+                its thoughts, a LinkTable of the THOUGHT_TO_THOUGHT links to and from them
+                and the names of the thoughts they are linked to.
+        """
+        cursor = self.connection.execute(
+            "SELECT id, name, kind, type_id, ac_type, label, forgotten_date_time, "
+            "tag_name, tag_paths FROM thoughts ORDER BY rowid"
+        )
+        while rows := cursor.fetchmany(batch_size):
+            nodes = [(row[0], self._thought(row)) for row in rows]
+            node_ids = [node_id for node_id, _ in nodes]
+
+            attachments = {}
+            for row in self._query_by_ids(
+                "SELECT source_id, location, name, type, source_type, note_type "
+                "FROM attachments WHERE source_id IN ({ids}) ORDER BY rowid",
+                node_ids,
+            ):
+                attachments.setdefault(row[0], []).append(Attachment(*row[1:]))
+            for node_id, node in nodes:
+                if node.kind == ThoughtKind.THOUGHT:
+                    node.attachments = tuple(attachments.get(node_id, ()))
+
+            # Tags in the order of the tags, then of their links (build_thought_tags_index)
+            thought_tags = {}
+            tag_rows = sorted(
+                self._query_by_ids(
+                    "SELECT tags.rowid, links.rowid, links.target, tags.tag_name, "
+                    "tags.tag_paths FROM links JOIN thoughts AS tags "
+                    "ON tags.id = links.source "
+                    "WHERE links.target IN ({ids}) AND links.meaning = ? "
+                    "AND tags.kind = ?",
+                    node_ids,
+                    LinkMeaning.TAG_TO_THOUGHT,
+                    ThoughtKind.TAG,
+                )
+            )
+            for _, _, node_id, tag_name, tag_paths in tag_rows:
+                thought_tags.setdefault(node_id, []).extend(
+                    (json.loads(tag_paths) if tag_paths else None) or [tag_name]
+                )
+
+            link_rows = {}
+            for direction in ("source", "target"):
+                for row in self._query_by_ids(
+                    "SELECT rowid, source, target, relation, meaning, direction, kind "
+                    f"FROM links WHERE {direction} IN ({{ids}}) AND meaning = ?",
+                    node_ids,
+                    LinkMeaning.THOUGHT_TO_THOUGHT,
+                ):
+                    link_rows[row[0]] = row[1:]
+            links_json = LinkTable()
+            related_ids = set()
+            for rowid in sorted(link_rows):
+                links_json.add(*link_rows[rowid])
+                related_ids.update(link_rows[rowid][:2])
+
+            thought_names = {
+                node_id: name
+                for node_id, name in self._query_by_ids(
+                    "SELECT id, name FROM thoughts WHERE id IN ({ids}) "
+                    "AND kind NOT IN (?, ?)",
+                    sorted(related_ids),
+                    ThoughtKind.TAG,
+                    ThoughtKind.TYPE,
+                )
+            }
+            yield nodes, (thought_tags, links_json, thought_names)
+
+
+class StoreNameAllocator(util.UniqueNameAllocator):
+    """
+    A UniqueNameAllocator that keeps the used names in the store's names table
+    instead of in memory.
+
+    New names are inserted insert_batch_size at a time, and the most recent
+    name_cache_size names are also kept in memory. Until the first of them is dropped
+    from memory, every name in the table is also in memory and the table is not
+    queried. After that, allocate_many looks up the names of a batch with one query
+    per query_parameter_limit names instead of one query per name.
+    """
+
+    def __init__(self, store, case_insensitive=False):
+        super().__init__(case_insensitive)
+        self.store = store
+        self._pending = set()
+        self._recent = OrderedDict()
+        self._free = set()
+        self._all_in_memory = (
+            store.connection.execute("SELECT 1 FROM names LIMIT 1").fetchone() is None
+        )
+
+    def _is_used(self, key):
+        if key in self._pending or key in self._recent:
+            return True
+        if self._all_in_memory or key in self._free:
+            return False
+        return (
+            self.store.connection.execute(
+                "SELECT 1 FROM names WHERE key = ?", (key,)
+            ).fetchone()
+            is not None
+        )
+
+    def _use(self, key):
+        self._free.discard(key)
+        self._pending.add(key)
+        if len(self._pending) >= insert_batch_size:
+            self.flush()
+
+    def allocate_many(self, original_names):
+        if self._all_in_memory:
+            return super().allocate_many(original_names)
+        keys = {self._key(name) for name in original_names}
+        self._free = {
+            key for key in keys if key not in self._pending and key not in self._recent
+        }
+        try:
+            for (key,) in self.store._query_by_ids(
+                "SELECT key FROM names WHERE key IN ({ids})", list(self._free)
+            ):
+                self._free.discard(key)
+            return super().allocate_many(original_names)
+        finally:
+            self._free = set()
+
+    def flush(self):
+        """
+        Inserts the names used since the last flush into the names table.
+        """
+        if not self._pending:
+            return
+        self.store.connection.executemany(
+            "INSERT OR IGNORE INTO names VALUES (?)",
+            ((key,) for key in sorted(self._pending)),
+        )
+        for key in self._pending:
+            self._recent[key] = None
+        while len(self._recent) > name_cache_size:
+            self._recent.popitem(last=False)
+            self._all_in_memory = False
+        self._pending = set()
+
+
+def open_store(path, reopen=False):
+    """
+    Creates an empty store at path, replacing the store of an earlier run, or with reopen
+    opens the store of an interrupted run to resume it.
+    """
+    if reopen:
+        logging.info(f"Reopening the parsed brain stored in: {path}")
+        return MigrationStore(path)
+    logging.info(f"Storing the parsed brain in: {path}")
+    return MigrationStore(path, create=True)
@@ -0,0 +1,152 @@
+import os
+import sys
+import io
+import json
+import time
+import logging
+import cProfile
+import pstats
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def _peak_rss_mb():
+    """
+    Returns the peak resident set size of the process so far in MB, or None if unknown.
+    """
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return max_rss / (1024 * 1024) if sys.platform == "darwin" else max_rss / 1024
+
+
+def _cpu_seconds():
+    """
+    Returns the CPU time used by the process and its finished child processes (e.g. the
+    markdown workers).
+    """
+    cpu_seconds = time.process_time()
+    if resource is not None:
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        cpu_seconds += children.ru_utime + children.ru_stime
+    return cpu_seconds
+
+
+class StageProfiler:
+    """
+    Records the wall time, CPU time, item counts and the peak RSS so far (of the run up to the
+    end of the stage, as the OS only reports the peak of the process) of each stage of the
+    migration.
+
+    Each stage is timed in a `with profiler.stage(name) as counts:` block, where counts is a
+    dict the stage fills with the number of items it processed, e.g. counts["notes"] = 100.
+    A "bytes" count is reported as MB/s, other counts as items/s.
+
+    Optionally the whole run is profiled with cProfile, and the peak memory allocated by
+    Python in each stage alone is traced with tracemalloc.
+    """
+
+    def __init__(self, use_cprofile=False, use_tracemalloc=False):
+        self.stages = []
+        self.start_time = time.perf_counter()
+        self.start_cpu = _cpu_seconds()
+        self.profile = None
+        if use_cprofile:
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        self.use_tracemalloc = use_tracemalloc
+        if use_tracemalloc:
+            tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name):
+        counts = {}
+        if self.use_tracemalloc:
+            tracemalloc.reset_peak()
+        start_time = time.perf_counter()
+        start_cpu = _cpu_seconds()
+        try:
+            yield counts
+        finally:
+            record = {
+                "name": name,
+                "wall_seconds": time.perf_counter() - start_time,
+                "cpu_seconds": _cpu_seconds() - start_cpu,
+                # The peak of the whole run up to the end of the stage, not of the stage alone
+                "peak_rss_so_far_mb": _peak_rss_mb(),
+                "counts": counts,
+                "throughput": {},
+            }
+            if self.use_tracemalloc:
+                record["traced_peak_mb"] = tracemalloc.get_traced_memory()[1] / (
+                    1024 * 1024
+                )
+            wall_seconds = max(record["wall_seconds"], 1e-9)
+            for key, value in counts.items():
+                if key == "bytes":
+                    record["throughput"]["mb_per_second"] = (
+                        value / (1024 * 1024) / wall_seconds
+                    )
+                else:
+                    record["throughput"][f"{key}_per_second"] = value / wall_seconds
+            self.stages.append(record)
+            logging.info(
+                f"Stage {name}: {record['wall_seconds']:.3f}s wall, "
+                f"{record['cpu_seconds']:.3f}s CPU, counts {counts}"
+            )
+
+    def report(self):
+        """
+        Returns the recorded stages and the totals of the run.
+        """
+        return {
+            "total_wall_seconds": time.perf_counter() - self.start_time,
+            "total_cpu_seconds": _cpu_seconds() - self.start_cpu,
+            "peak_rss_mb": _peak_rss_mb(),
+            "python": sys.version.split()[0],
+            "stages": self.stages,
+        }
+
+    def save(self, report_path):
+        """
+        Saves the report as JSON and prints the time of each stage. With cProfile the profile
+        is saved next to it (.prof, e.g. for snakeviz) and its top functions are logged.
+
+        Returns:
+            dict: The report.
+        """
+        report = self.report()
+        if self.profile is not None:
+            self.profile.disable()
+            profile_path = f"{os.path.splitext(report_path)[0]}.prof"
+            self.profile.dump_stats(profile_path)
+            report["cprofile"] = profile_path
+            stats_output = io.StringIO()
+            pstats.Stats(self.profile, stream=stats_output).sort_stats(
+                "cumulative"
+            ).print_stats(30)
+            logging.info(f"cProfile top functions:\n{stats_output.getvalue()}")
+        if self.use_tracemalloc:
+            tracemalloc.stop()
+
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=4)
+
+        print("Stage timings:")
+        for record in report["stages"]:
+            throughput = ", ".join(
+                f"{value:.1f} {'MB' if key == 'mb_per_second' else key[:-11]}/s"
+                for key, value in record["throughput"].items()
+            )
+            print(
+                f"  {record['name']:<22} {record['wall_seconds']:8.3f}s"
+                + (f"  {throughput}" if throughput else "")
+            )
+        print(f"Profile report written to: {report_path}")
+        return report
@@ -0,0 +1,314 @@
+import os
+import json
+import uuid
+import random
+import argparse
+from TheBrainConstants import (
+    ThoughtKind,
+    ThoughtAccessType,
+    LinkKind,
+    LinkMeaning,
+    LinkRelation,
+    LinkDirection,
+    AttachmentType,
+    AttachmentNoteType,
+    AttachmentSourceType,
+)
+
+# Names shared by many thoughts, including names that only differ by case or accents and
+# names with characters that are invalid in file names
+duplicate_names = [
+    "Meeting",
+    "meeting",
+    "Notes",
+    "Ideas",
+    "Café",
+    "Cafe\u0301",
+    "2020 01 02",
+    "a/b: c?",
+    "To do #1",
+]
+
+
+def _write_records(file_path, records):
+    """
+    Writes records to one of TheBrain's line-delimited export files, one JSON object per line.
+    """
+    with open(file_path, "w", encoding="utf-8-sig") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False))
+            f.write("\n")
+
+
+def _notes_md(rng, thought_index, thought_ids, image_name):
+    """
+    Returns the content of a synthetic Notes.md with the markup the migration rewrites.
+    """
+    linked_id = thought_ids[rng.randrange(len(thought_ids))]
+    lines = [
+        f"# Thought {thought_index}",
+        "",
+        f"See [a related thought](brain://api.thebrain.com/abc/{linked_id}/) for details.",
+        "+ done item",
+        "- open item",
+        "[ ] square bracket item",
+        f"Meeting on [[{rng.randint(2000, 2024)} {rng.randint(1, 12):02d} {rng.randint(1, 28):02d}]]",
+    ]
+    if image_name:
+        lines.append(f"![image](.data/md-images/{image_name}#center)")
+    lines += ["", "Lorem ipsum dolor sit amet. " * rng.randint(1, 20)]
+    return "\n".join(lines) + "\n"
+
+
+def generate_export(
+    output_dir,
+    thoughts=1000,
+    seed=1,
+    tags=None,
+    tag_depth=8,
+    types=None,
+    duplicate_ratio=0.05,
+    forgotten_ratio=0.02,
+    notes_ratio=0.5,
+    md_image_ratio=0.2,
+    attachment_ratio=0.1,
+    folder_ratio=0.02,
+    attachment_size=4096,
+):
+    """
+    Generates a synthetic TheBrain JSON export of a given size: thoughts.json, links.json and
+    attachments.json in TheBrain's line-delimited format, and a folder per thought with its
+    Notes.md, md-images, attachments and attachment folders. The export is the same for the
+    same arguments.
+
+    Args:
+        output_dir (str): The directory the export is written to.
+        thoughts (int): The number of thoughts, excluding tags and types.
+        seed (int): The seed of the random generator.
+        tags (int): The number of tags, by default 2% of the thoughts (at least 10).
+        tag_depth (int): The depth of the tag tree.
+        types (int): The number of types, by default 0.5% of the thoughts (at least 3).
+        duplicate_ratio (float): The share of thoughts named from duplicate_names.
+        forgotten_ratio (float): The share of forgotten thoughts.
+        notes_ratio (float): The share of thoughts with a Notes.md.
+        md_image_ratio (float): The share of Notes.md with an embedded md-image.
+        attachment_ratio (float): The share of thoughts with an attached file.
+        folder_ratio (float): The share of thoughts with an attached folder.
+        attachment_size (int): The size of each attached file and md-image in bytes.
+
+    Returns:
+        dict: The number of records and files written.
+    """
+    rng = random.Random(seed)
+    tags = tags if tags is not None else max(10, thoughts // 50)
+    types = types if types is not None else max(3, thoughts // 200)
+    os.makedirs(output_dir, exist_ok=True)
+
+    def new_id():
+        return str(uuid.UUID(int=rng.getrandbits(128)))
+
+    tag_ids = [new_id() for _ in range(tags)]
+    type_ids = [new_id() for _ in range(types)]
+    thought_ids = [new_id() for _ in range(thoughts)]
+    counts = {"thoughts": thoughts, "tags": tags, "types": types, "links": 0}
+    counts.update({"notes_md": 0, "md_images": 0, "attachments": 0, "folders": 0})
+
+    def thought_records():
+        for index, tag_id in enumerate(tag_ids):
+            yield {
+                "Id": tag_id,
+                "Name": f"tag {index % (tags // 2 or 1)}",
+                "Kind": ThoughtKind.TAG,
+                "ACType": ThoughtAccessType.PUBLIC,
+            }
+        for index, type_id in enumerate(type_ids):
+            yield {
+                "Id": type_id,
+                "Name": f"Type {index}",
+                "Kind": ThoughtKind.TYPE,
+                "ACType": ThoughtAccessType.PUBLIC,
+            }
+        for index, thought_id in enumerate(thought_ids):
+            record = {
+                "Id": thought_id,
+                "Name": (
+                    rng.choice(duplicate_names)
+                    if rng.random() < duplicate_ratio
+                    else f"Thought {index}"
+                ),
+                "Kind": ThoughtKind.THOUGHT,
+                "ACType": rng.choice(
+                    [ThoughtAccessType.PUBLIC, ThoughtAccessType.PRIVATE]
+                ),
+            }
+            if rng.random() < 0.1:
+                record["Label"] = rng.choice(["label", "x: y", "true", "123"])
+            if rng.random() < forgotten_ratio:
+                record["ForgottenDateTime"] = "2020-01-01T00:00:00.000Z"
+            yield record
+
+    _write_records(os.path.join(output_dir, "thoughts.json"), thought_records())
+
+    def link(thought_id_a, thought_id_b, meaning, relation, kind=LinkKind.NORMAL_LINK):
+        counts["links"] += 1
+        return {
+            "Id": new_id(),
+            "ThoughtIdA": thought_id_a,
+            "ThoughtIdB": thought_id_b,
+            "Meaning": meaning,
+            "Relation": relation,
+            "Direction": LinkDirection.DEFAULT,
+            "Kind": kind,
+        }
+
+    def link_records():
+        # Tag tree: each level's tags are children of tags of the level above
+        level_size = max(1, -(-tags // tag_depth))
+        for index in range(level_size, tags):
+            parent_level_start = (index // level_size - 1) * level_size
+            yield link(
+                tag_ids[parent_level_start + rng.randrange(level_size)],
+                tag_ids[index],
+                LinkMeaning.TAGS_TO_TAGS,
+                LinkRelation.PARENT_TO_CHILD,
+                LinkKind.LINK_TYPE,
+            )
+        for index in range(1, types):
+            yield link(
+                type_ids[rng.randrange(index)],
+                type_ids[index],
+                LinkMeaning.TYPE_TO_TYPE,
+                LinkRelation.PARENT_TO_CHILD,
+                LinkKind.LINK_TYPE,
+            )
+        for index, thought_id in enumerate(thought_ids):
+            for _ in range(rng.randint(0, 2)):
+                yield link(
+                    rng.choice(tag_ids),
+                    thought_id,
+                    LinkMeaning.TAG_TO_THOUGHT,
+                    LinkRelation.PARENT_TO_CHILD,
+                    LinkKind.LINK_TYPE,
+                )
+            if rng.random() < 0.3:
+                yield link(
+                    rng.choice(type_ids),
+                    thought_id,
+                    LinkMeaning.TYPE_TO_THOUGHT,
+                    LinkRelation.PARENT_TO_CHILD,
+                    LinkKind.LINK_TYPE,
+                )
+            # A tree of thoughts with jump and sibling links across it
+            if index:
+                yield link(
+                    thought_ids[rng.randrange(index)],
+                    thought_id,
+                    LinkMeaning.THOUGHT_TO_THOUGHT,
+                    LinkRelation.PARENT_TO_CHILD,
+                )
+            for _ in range(rng.randint(0, 2)):
+                yield link(
+                    thought_id,
+                    rng.choice(thought_ids),
+                    LinkMeaning.THOUGHT_TO_THOUGHT,
+                    rng.choice([LinkRelation.JUMP, LinkRelation.SIBLING]),
+                )
+
+    _write_records(os.path.join(output_dir, "links.json"), link_records())
+
+    def attachment_records():
+        for index, thought_id in enumerate(thought_ids):
+            has_notes = rng.random() < notes_ratio
+            has_attachment = rng.random() < attachment_ratio
+            has_folder = rng.random() < folder_ratio
+            if not (has_notes or has_attachment or has_folder):
+                continue
+            thought_dir = os.path.join(output_dir, thought_id)
+            os.makedirs(thought_dir, exist_ok=True)
+
+            if has_notes:
+                image_name = None
+                if rng.random() < md_image_ratio:
+                    image_name = f"image{index}.png"
+                    md_images_dir = os.path.join(thought_dir, ".data", "md-images")
+                    os.makedirs(md_images_dir, exist_ok=True)
+                    with open(os.path.join(md_images_dir, image_name), "wb") as f:
+                        f.write(rng.randbytes(attachment_size))
+                    counts["md_images"] += 1
+                with open(
+                    os.path.join(thought_dir, "Notes.md"), "w", encoding="utf-8"
+                ) as f:
+                    f.write(_notes_md(rng, index, thought_ids, image_name))
+                counts["notes_md"] += 1
+                yield {
+                    "SourceId": thought_id,
+                    "Location": "Notes.md",
+                    "Name": "Notes.md",
+                    "Type": AttachmentType.NOTES_V9,
+                    "SourceType": AttachmentSourceType.ATTACHMENT,
+                    "NoteType": AttachmentNoteType.NOTES_MD,
+                }
+
+            if has_attachment:
+                file_name = f"document {index}.pdf"
+                with open(os.path.join(thought_dir, file_name), "wb") as f:
+                    f.write(rng.randbytes(attachment_size))
+                counts["attachments"] += 1
+                yield {
+                    "SourceId": thought_id,
+                    "Location": file_name,
+                    "Name": file_name,
+                    "Type": AttachmentType.INTERNAL_FILE,
+                    "SourceType": AttachmentSourceType.ATTACHMENT,
+                    "NoteType": AttachmentNoteType.ATTACHMENT,
+                }
+                yield {
+                    "SourceId": thought_id,
+                    "Location": f"https://example.com/{index}",
+                    "Name": f"Link {index}",
+                    "Type": AttachmentType.EXTERNAL_URL,
+                    "SourceType": AttachmentSourceType.ATTACHMENT,
+                    "NoteType": AttachmentNoteType.ATTACHMENT,
+                }
+
+            if has_folder:
+                folder_path = os.path.join(thought_dir, f"folder {index}", "sub")
+                os.makedirs(folder_path, exist_ok=True)
+                with open(os.path.join(folder_path, "file.txt"), "wb") as f:
+                    f.write(rng.randbytes(attachment_size))
+                counts["folders"] += 1
+
+    _write_records(os.path.join(output_dir, "attachments.json"), attachment_records())
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Generate a synthetic TheBrain JSON export for testing and benchmarks."
+    )
+    parser.add_argument("output_dir", help="The directory the export is written to.")
+    parser.add_argument(
+        "--thoughts", type=int, default=1000, help="Number of thoughts (default: 1000)."
+    )
+    parser.add_argument(
+        "--seed", type=int, default=1, help="Seed of the random generator."
+    )
+    parser.add_argument(
+        "--attachment-size",
+        type=int,
+        default=4096,
+        help="Size of each attached file and md-image in bytes (default: 4096).",
+    )
+    args = parser.parse_args()
+
+    counts = generate_export(
+        args.output_dir,
+        args.thoughts,
+        args.seed,
+        attachment_size=args.attachment_size,
+    )
+    print(f"Synthetic export written to {args.output_dir}: {counts}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import os
+import sys
+import subprocess
+import pytest
+
+# The scripts import each other as top-level modules
+package_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, package_directory)
+
+import benchmark
+import synthetic_export
+
+# Runs the migration of ./export to ./obsidian in the current directory, like
+# benchmark.migration_runner. With fail_note, writing that markdown file fails.
+migration_runner = """
+import sys
+sys.path.insert(0, {package_directory!r})
+import enduser_config as config
+config.dir_location_of_Brain_folder = {export!r}
+config.dir_location_of_obsidian_vault = "./obsidian"
+for name, value in {settings!r}.items():
+    setattr(config, name, value)
+sys.argv = ["thebrain2markdown.py", *{arguments!r}]
+import utility
+import thebrain2markdown
+write_file_if_changed = utility.write_file_if_changed
+def fail_note(file_path, content):
+    if file_path.endswith({fail_note!r}):
+        raise OSError("injected failure")
+    return write_file_if_changed(file_path, content)
+if {fail_note!r}:
+    utility.write_file_if_changed = fail_note
+thebrain2markdown.main()
+"""
+
+
+@pytest.fixture(scope="session")
+def synthetic_export_directory(tmp_path_factory):
+    """
+    A small synthetic export with notes, duplicate names, attachments and folders.
+    """
+    export_directory = str(tmp_path_factory.mktemp("synthetic") / "export")
+    synthetic_export.generate_export(export_directory, thoughts=300, seed=7)
+    return export_directory
+
+
+@pytest.fixture(scope="session")
+def migrate():
+    """
+    Returns a function running a migration in a separate process, as the migration reads
+    enduser_config when it is imported. It returns the printed output.
+    """
+
+    def run(run_directory, export, *arguments, fail_note="", **settings):
+        os.makedirs(run_directory, exist_ok=True)
+        result = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                migration_runner.format(
+                    package_directory=package_directory,
+                    export=os.path.abspath(export),
+                    settings={**benchmark.benchmark_settings, **settings},
+                    arguments=[str(argument) for argument in arguments],
+                    fail_note=fail_note,
+                ),
+            ],
+            cwd=run_directory,
+            capture_output=True,
+            text=True,
+        )
+        assert result.returncode == 0, result.stderr
+        return result.stdout
+
+    return run
+
+
+def read_vault(vault_directory):
+    """
+    Returns relative path -> content of the files of a vault, without the state kept
+    between runs.
+    """
+    files = {}
+    for root, dirs, names in os.walk(vault_directory):
+        dirs[:] = [name for name in dirs if name != ".thebrain2markdown"]
+        for name in names:
+            path = os.path.join(root, name)
+            with open(path, "rb") as f:
+                files[os.path.relpath(path, vault_directory)] = f.read()
+    return files
@@ -0,0 +1,123 @@
+import os
+import zipfile
+import pytest
+import export_source
+import utility as util
+
+
+def zip_export(export_directory, zip_path, extra_members=()):
+    """
+    Zips an export under a top-level folder, as TheBrain exports it, with extra_members
+    (name, data) added to that folder.
+    """
+    with zipfile.ZipFile(zip_path, "w") as archive:
+        for root, _, names in os.walk(export_directory):
+            for name in names:
+                path = os.path.join(root, name)
+                relative_path = os.path.relpath(path, export_directory)
+                archive.write(path, f"MyBrain/{relative_path.replace(os.sep, '/')}")
+        for name, data in extra_members:
+            archive.writestr(f"MyBrain/{name}", data)
+    return zip_path
+
+
+def comparable_index(export_index, root):
+    """
+    Returns an export index with paths relative to root and without mtimes, which differ
+    between a directory and a zip archive, and with its lists sorted.
+    """
+
+    def relative(path):
+        return os.path.relpath(path, root).replace(os.sep, "/")
+
+    comparable = {}
+    for thought_id, folder_index in export_index.items():
+        notes = folder_index["notes"]
+        comparable[thought_id] = {
+            "notes": notes and (relative(notes["path"]), notes["size"]),
+            "files": sorted(
+                (name, relative(path), size)
+                for name, path, size in folder_index["files"]
+            ),
+            "md_images": sorted(
+                (name, relative(path), size)
+                for name, path, size in folder_index["md_images"]
+            ),
+            "folders": sorted(
+                (
+                    name,
+                    relative(path),
+                    sorted(sub_folders),
+                    sorted(
+                        (relative_path, relative(file_path), size)
+                        for relative_path, file_path, size in sub_files
+                    ),
+                )
+                for name, path, sub_folders, sub_files in folder_index["folders"]
+            ),
+        }
+    return comparable
+
+
+def test_zip_scan_matches_directory_scan(synthetic_export_directory, tmp_path):
+    zip_path = zip_export(synthetic_export_directory, tmp_path / "export.zip")
+    directory_index = export_source.open_export_source(
+        synthetic_export_directory
+    ).scan()
+    source = export_source.open_export_source(str(zip_path))
+    try:
+        zip_index = source.scan()
+    finally:
+        source.close()
+
+    assert isinstance(source, export_source.ZipExportSource)
+    assert any(folder_index["folders"] for folder_index in directory_index.values())
+    assert comparable_index(zip_index, "MyBrain") == comparable_index(
+        directory_index, synthetic_export_directory
+    )
+
+
+@pytest.mark.parametrize(
+    "member",
+    [
+        "{thought_id}/../../escape.txt",
+        "{thought_id}/folder/../../../escape.txt",
+        "{thought_id}/./dot.txt",
+        "{thought_id}//absolute.txt",
+        "{thought_id}/C:escape.txt",
+    ],
+)
+def test_zip_scan_skips_unsafe_members(
+    synthetic_export_directory, tmp_path, caplog, member
+):
+    thought_id = next(
+        name
+        for name in sorted(os.listdir(synthetic_export_directory))
+        if os.path.isdir(os.path.join(synthetic_export_directory, name))
+    )
+    member = member.format(thought_id=thought_id)
+    zip_path = zip_export(
+        synthetic_export_directory, tmp_path / "export.zip", [(member, b"x")]
+    )
+    directory_index = export_source.open_export_source(
+        synthetic_export_directory
+    ).scan()
+    source = export_source.open_export_source(str(zip_path))
+    try:
+        zip_index = source.scan()
+    finally:
+        source.close()
+
+    assert comparable_index(zip_index, "MyBrain") == comparable_index(
+        directory_index, synthetic_export_directory
+    )
+    assert f"Skipped member with an unsafe path: MyBrain/{member}" in caplog.text
+
+
+def test_is_within_directory(tmp_path):
+    assert util.is_within_directory(str(tmp_path / "a" / "b.txt"), str(tmp_path))
+    assert util.is_within_directory(str(tmp_path / "a" / ".." / "b"), str(tmp_path))
+    assert not util.is_within_directory(
+        str(tmp_path / "a" / ".." / ".." / "b"), str(tmp_path)
+    )
+    assert not util.is_within_directory(str(tmp_path) + "-other", str(tmp_path))
@@ -0,0 +1,74 @@
+import os
+import re
+import pytest
+from conftest import read_vault
+
+
+@pytest.fixture(scope="module")
+def reference_vault(synthetic_export_directory, migrate, tmp_path_factory):
+    """
+    The vault of a migration of the synthetic export with the benchmark settings.
+    """
+    run_directory = tmp_path_factory.mktemp("reference")
+    migrate(run_directory, synthetic_export_directory)
+    return read_vault(os.path.join(run_directory, "obsidian"))
+
+
+def markdown_summary(output):
+    """
+    Returns the counts of the "Markdown files: ..." line printed by a migration.
+    """
+    line = next(
+        line for line in output.splitlines() if line.startswith("Markdown files:")
+    )
+    return {label: int(count) for count, label in re.findall(r"(\d+) ([a-z ]+)", line)}
+
+
+@pytest.mark.parametrize(
+    "arguments, settings",
+    [
+        (["--workers", "2"], {}),
+        ([], {"use_sqlite_store": True}),
+        (["--workers", "2"], {"use_sqlite_store": True}),
+    ],
+    ids=["workers", "sqlite", "workers-sqlite"],
+)
+def test_vault_is_the_same_in_every_mode(
+    synthetic_export_directory, migrate, reference_vault, tmp_path, arguments, settings
+):
+    migrate(tmp_path, synthetic_export_directory, *arguments, **settings)
+
+    assert any(path.endswith(".md") for path in reference_vault)
+    assert read_vault(tmp_path / "obsidian") == reference_vault
+
+
+def test_resume_retries_only_the_failed_note(
+    synthetic_export_directory, migrate, reference_vault, tmp_path
+):
+    failed_note = sorted(
+        path for path in reference_vault if path.endswith(".md") and os.sep not in path
+    )[10]
+    checkpoint_path = tmp_path / "obsidian" / ".thebrain2markdown" / "checkpoint.jsonl"
+
+    output = migrate(tmp_path, synthetic_export_directory, fail_note=failed_note)
+    assert markdown_summary(output)["failed"] == 1
+    assert failed_note not in read_vault(tmp_path / "obsidian")
+    assert checkpoint_path.exists()
+
+    output = migrate(tmp_path, synthetic_export_directory, "--resume")
+    summary = markdown_summary(output)
+    assert summary["written"] == 1
+    assert summary["failed"] == 0
+    assert (
+        summary["written before the resume"]
+        == len(
+            [
+                path
+                for path in reference_vault
+                if path.endswith(".md") and os.sep not in path
+            ]
+        )
+        - 1
+    )
+    assert read_vault(tmp_path / "obsidian") == reference_vault
+    assert not checkpoint_path.exists()
@@ -0,0 +1,25 @@
+import pytest
+import yaml
+import migration_functions as mig_funcs
+
+
+@pytest.mark.parametrize(
+    "yaml_data",
+    [
+        {"exTheBrain": "abc-123", "publish": "true", "tags": ["Tag", "Parent/Child"]},
+        {"tags": [], "aliases": [""], "publish": ""},
+        {"tags": ["yes", "No", "1.5", "2024-01-01", "~", "null", "0x1F", "1e3"]},
+        {"aliases": ["with: colon", "#hash", "- dash", "'quoted'", '"double"']},
+        {"aliases": ["trailing ", " leading", "tab\there", "line\nbreak"]},
+        {"aliases": ["Ünïcödé", "日本語", "emoji 🧠", "á"]},
+        {"aliases": ["a " * 40, "word" * 30]},
+        {"tags": ["&anchor", "*alias", "!tag", "%percent", "@at", "`tick", "|", ">"]},
+        {"tags": ["[list]", "{map}", "a, b", "?", "key: value", "a #comment"]},
+        {"publish": True, "count": 3, "nested": {"a": ["b"]}, "none": None},
+        {"b": "2", "a": "1", "C": "3"},
+    ],
+)
+def test_render_frontmatter_matches_yaml_dump(yaml_data):
+    assert mig_funcs.render_frontmatter(yaml_data) == yaml.dump(
+        yaml_data, default_flow_style=False
+    )
@@ -0,0 +1,55 @@
+import random
+import pytest
+import migration_store
+import utility as util
+
+
+def random_names(count, seed):
+    """
+    Names with many duplicates, including ones that differ only by case or Unicode
+    normalization and ones that look like renamed duplicates.
+    """
+    rng = random.Random(seed)
+    names = ["Notes", "notes", "NOTES", "Notes 001", "Café", "Café", "a", "A"]
+    return [
+        rng.choice(names) if rng.random() < 0.5 else f"Thought {rng.randint(0, 50)}"
+        for _ in range(count)
+    ]
+
+
+@pytest.mark.parametrize("case_insensitive", [False, True])
+@pytest.mark.parametrize(
+    "name_cache_size, insert_batch_size", [(100000, 10000), (7, 5), (1, 1), (2, 50)]
+)
+def test_store_allocator_matches_memory_allocator(
+    tmp_path, monkeypatch, case_insensitive, name_cache_size, insert_batch_size
+):
+    # Small sizes exercise names that are only in the table
+    monkeypatch.setattr(migration_store, "name_cache_size", name_cache_size)
+    monkeypatch.setattr(migration_store, "insert_batch_size", insert_batch_size)
+    names = random_names(2000, seed=3)
+    memory_allocator = util.UniqueNameAllocator(case_insensitive)
+    expected = [memory_allocator.allocate(name) for name in names]
+
+    with migration_store.open_store(str(tmp_path / "brain.sqlite")) as store:
+        store_allocator = migration_store.StoreNameAllocator(store, case_insensitive)
+        allocated = []
+        for start in range(0, len(names), 40):
+            allocated.extend(store_allocator.allocate_many(names[start : start + 40]))
+        allocated.append(store_allocator.allocate("Notes"))
+        store_allocator.flush()
+        stored = store.connection.execute("SELECT COUNT(*) FROM names").fetchone()[0]
+
+    assert allocated == expected + [memory_allocator.allocate("Notes")]
+    assert len(set(map(store_allocator._key, allocated))) == len(allocated) == stored
+
+
+def test_allocator_renames_duplicates():
+    allocator = util.UniqueNameAllocator(case_insensitive=True)
+    allocator.reserve("Notes 001")
+    assert allocator.allocate_many(["Notes", "notes", "NOTES", "Other"]) == [
+        "Notes",
+        "notes 002",
+        "NOTES 003",
+        "Other",
+    ]
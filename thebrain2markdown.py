@@ -1,24 +1,32 @@
 import json
 import os
+import sys
+import argparse
 import logging
-from datetime import datetime
-import yaml  # Add this import for YAML serialization
+import logging.handlers
+from collections import deque
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
 from TheBrainConstants import (
     ThoughtKind,
     ThoughtAccessType,
-    LinkKind,
     LinkMeaning,
     LinkRelation,
-    LinkDirection,
     AttachmentType,
     AttachmentNoteType,
     AttachmentSourceType,
 )
-import re
 import utility as util
 import enduser_config as config
 import migration_functions as mig_funcs
-
+import incremental_migration as incremental
+import vault_link_index as link_idx
+import integrity_check as integrity
+import stage_profiler
+import export_source as export_src
+import migration_store
+import migration_checkpoint as checkpoint
+from graph_model import Attachment, Thought, LinkTable, records_to_json
 
 # Directories for file migration
 TheBrain_export_dir = config.dir_location_of_Brain_folder
@@ -26,224 +34,172 @@ TheBrain_export_dir = config.dir_location_of_Brain_folder
 # Directories for file migration
 obsidian_vault_directory = config.dir_location_of_obsidian_vault
 output_directory = "./JSONS"
-
-# Ensure the output directory exists
-if not os.path.exists(output_directory):
-    os.makedirs(output_directory)
-
-# Define input files and output directory
-path_to_TheBrain_JSON_files = [
-    os.path.join(TheBrain_export_dir, "links.json"),
-    os.path.join(TheBrain_export_dir, "attachments.json"),
-    os.path.join(TheBrain_export_dir, "thoughts.json"),
+# Folder in the obsidian vault for state kept between runs, e.g. the attachment sync manifest
+state_directory = os.path.join(obsidian_vault_directory, ".thebrain2markdown")
+# Thoughts whose unique names are allocated at once, see iter_thoughts
+name_batch_size = 500
+attachments_manifest_path = os.path.join(state_directory, "attachments_manifest.json")
+notes_state_path = os.path.join(state_directory, "notes_state.json")
+# SQLite store of the parsed brain, with use_sqlite_store
+store_path = os.path.join(output_directory, "brain.sqlite")
+# Progress journal of the migration, resumed with --resume after an interruption
+checkpoint_path = os.path.join(state_directory, "checkpoint.jsonl")
+
+# Define input files, read from the export directory or zip archive (see export_source)
+TheBrain_links_file = "links.json"
+TheBrain_attachments_file = "attachments.json"
+TheBrain_thoughts_file = "thoughts.json"
+TheBrain_JSON_files = [
+    TheBrain_links_file,
+    TheBrain_attachments_file,
+    TheBrain_thoughts_file,
 ]  # Add more files as needed
 
 
-# Paths to refactored input JSON files
-thoughts_path = "./JSONS/TB_Refactored_thoughts.json"
-links_path = "./JSONS/TB_Refactored_links.json"
-attachments_path = "./JSONS/TB_Refactored_Attachments.json"
-
 # Invalid file characters
 invalid_file_characters = ["/", "*", "?", "|", "\\", '"', "<", ">", ":", ";", "#", "@"]
 # List of common image file extensions
 file_extensions_images = [".png", ".jpg", ".jpeg", ".gif", ".bmp", ".tiff", ".svg"]
 
-# filepaths for outputting dictionaries created as json files for use and/or debugging
-Links_json_output_file_path = "./JSONS/links_json.json"
-
-
-# Configure logging
-# Set up logging
-log_file = util.setup_logging(log_directory="./logs", log_prefix="migration")
-print(f"Log file created: {log_file}")
-
-
-# Initialize dictionaries
-nodes_json = {}
-list_of_thoughts = {}
-list_of_tags = {}
-list_of_types = {}
-links_json = {}
-attachments_json = {}
-
-
-# Clear the obsidian vault directory if required
-if config.empty_obsidian_vault_dir_prior_to_running_the_script:
-    # Check if the directory exists before clearing it
-    if os.path.exists(obsidian_vault_directory):
-        # Clear the content of the obsidian vault directory, excluding ".obsidian"
-        # retain obsidian config files
-        util.clear_folder(obsidian_vault_directory, [".obsidian"])
-        print(
-            f"Cleared content of the directory: {obsidian_vault_directory}, excluding .obsidian folder."
-        )
-    else:
-        # Create the directory if it doesn't exist
-        os.makedirs(obsidian_vault_directory)
-        logging.info(f"Created directory: {obsidian_vault_directory}")
-        print(f"Created directory: {obsidian_vault_directory}")
-
-
-# clear down the obsidian vault directory
-util.clear_folder(output_directory, exclude_list=["/.obsidian"])
-
-# convert TheBrain JSON files to a format suitable for Obsidian
-# and save them in the output directory
-util.Serialise_TBjson_files(path_to_TheBrain_JSON_files, output_directory)
-
-
-# create subdirectories in the obsidian vault directory
-
-destination_dir_documents = os.path.join(obsidian_vault_directory, "data/documents")
-destination_dir_embedded_images = os.path.join(
-    obsidian_vault_directory, "data/embedded images"
-)
-destination_dir_document_folders = os.path.join(
-    obsidian_vault_directory, "data/document_folders"
+# Transforms applied, in order, to the content of each Notes.md as its note is rendered
+notes_body_transforms = mig_funcs.get_body_transforms(
+    mig_funcs.default_body_transform_names + config.optional_notes_body_transforms
 )
 
-for directory in [
-    destination_dir_documents,
-    destination_dir_embedded_images,
-    destination_dir_document_folders,
-]:
-    if not os.path.exists(directory):
-        os.makedirs(directory)
-        logging.info(f"Created directory: {directory}")
-    else:
-        logging.info(f"Directory already exists: {directory}")
-
+# Excalibrain field of a related thought, in the order they are appended to a note, by the
+# LinkRelation of the link and whether the link is to the thought (incoming) or owned by it
+excalibrain_relation_fields = [
+    ("parent", LinkRelation.PARENT_TO_CHILD, True),
+    ("parent", LinkRelation.PARENT, False),
+    ("child", LinkRelation.PARENT_TO_CHILD, False),
+    ("child", LinkRelation.PARENT, True),
+    ("jump", LinkRelation.JUMP, False),
+    ("jump", LinkRelation.JUMP, True),
+    ("sibling", LinkRelation.SIBLING, False),
+    ("sibling", LinkRelation.SIBLING, True),
+]
 
-# move attacchment in the export Brain directory to the obsidian vault directory
-util.process_exported_attachments(
-    TheBrain_export_dir,
-    destination_dir_documents,
-    destination_dir_embedded_images,
-    destination_dir_document_folders,
-)
+# filepaths for outputting dictionaries created as json files for use and/or debugging
+Links_json_output_file_path = "./JSONS/links_json.json"
 
 
-# Process links.json to build relationships
-def create_links_json_dic(links_path, links_json):
+# Process the link records of links.json into the LinkTable links_json
+def create_links_json_dic(link_records, links_json):
     try:
-        with open(links_path, "r", encoding="utf-8") as links_file:
-            data = json.load(links_file)
-            for item in data:
-                node_id = item["ThoughtIdA"]
-                if item["Meaning"] != LinkMeaning.NOTTHING:
-                    links_json.setdefault(node_id, [])
-                    links_json[node_id].append(
-                        {
-                            "ID": item["ThoughtIdB"],
-                            "relation_type": item["Relation"],
-                            "relation_key": item["Relation"],
-                            "meaning_key": item["Meaning"],
-                            "direction_key": item["Direction"],
-                            "kind": item["Kind"],
-                        }
-                    )
+        for item in link_records:
+            if item["Meaning"] != LinkMeaning.NOTTHING:
+                links_json.add(
+                    item["ThoughtIdA"],
+                    item["ThoughtIdB"],
+                    item["Relation"],
+                    item["Meaning"],
+                    item["Direction"],
+                    item["Kind"],
+                )
     except Exception as e:
         logging.error(f"Failed to process links.json. Error: {e}")
         print(f"Failed to process links.json. Error: {e}")
 
 
-# Process attachments.json to map attachments to nodes
-def create_attachments_json_dic(attachments_path, attachments_json):
+# Process the attachment records of attachments.json to map attachments to nodes
+def create_attachments_json_dic(attachment_records, attachments_json):
     try:
-        with open(attachments_path, "r", encoding="utf-8-sig") as attachments_file:
-            data = json.load(attachments_file)
-            for item in data:
-                node_id = item["SourceId"]
-                attachments_json.setdefault(node_id, [])
-                attachments_json[node_id].append(
-                    {
-                        "location": item["Location"],
-                        "name": item["Name"],
-                        "type": item["Type"],
-                        "source_type": item["SourceType"],
-                        "note_type": item["NoteType"],
-                    }
+        for item in attachment_records:
+            node_id = sys.intern(item["SourceId"])
+            attachments_json.setdefault(node_id, [])
+            attachments_json[node_id].append(
+                Attachment(
+                    item["Location"],
+                    item["Name"],
+                    item["Type"],
+                    item["SourceType"],
+                    item["NoteType"],
                 )
+            )
     except Exception as e:
         logging.error(f"Failed to process attachments.json. Error: {e}")
         print(f"Failed to process attachments.json. Error: {e}")
 
 
-# Process thoughts.json to build nodes and their metadata
+def iter_thoughts(
+    thought_records, invalid_file_characters, name_allocator, attachments_json
+):
+    """
+    Converts thought records of thoughts.json to Thought records with unique names.
+    Thoughts get their attachments from attachments_json, tags their TagName.
+    Names are allocated name_batch_size thoughts at a time.
+
+    Yields:
+        Thought: One record per thought, tag or type.
+    """
+    thought_records = iter(thought_records)
+    while batch := list(islice(thought_records, name_batch_size)):
+        original_names = [
+            util.remove_invalid_character(thought["Name"], "", invalid_file_characters)
+            for thought in batch
+        ]
+        unique_names = name_allocator.allocate_many(original_names)
+        for thought, original_name, unique_name in zip(
+            batch, original_names, unique_names
+        ):
+            node_id = sys.intern(thought["Id"])
+            if unique_name != original_name:
+                print(
+                    f"Duplicate file found: {original_name}. Renamed to: {unique_name}"
+                )
+
+            node = Thought(
+                node_id,
+                unique_name,
+                thought["Kind"],
+                thought.get("TypeId", ""),
+                thought.get("ACType", ThoughtAccessType.PUBLIC),
+                thought.get("Label", ""),
+                thought.get("ForgottenDateTime", ""),
+            )
+
+            # Add attachments
+            if thought["Kind"] == ThoughtKind.THOUGHT:
+                node.attachments = tuple(attachments_json.get(node_id, ()))
+
+            if node.kind == ThoughtKind.TAG:
+                node.tag_name = util.remove_invalid_character(
+                    thought["Name"], "_", invalid_file_characters
+                )
+            yield node
+
+
+# Process the thought records of thoughts.json to build nodes and their metadata
+# Every dictionary refers to the same Thought record, their links are in the LinkTable
 def create_thoughts_json_dic_with_links_attachments(
-    thoughts_path,
+    thought_records,
     invalid_file_characters,
     nodes_json,
     list_of_thoughts,
     list_of_tags,
     list_of_types,
-    links_json,
     attachments_json,
 ):
-    try:
-        with open(thoughts_path, "r", encoding="utf-8-sig") as thoughts_file:
-            thought_object = json.load(thoughts_file)
-            for thought in thought_object:
-                node_id = thought["Id"]
-                original_name = util.remove_invalid_character(
-                    thought["Name"], "", invalid_file_characters
-                )
-                unique_name = original_name
-
-                # Ensure the thought name is unique
-                counter = 1
-                while any(node["Name"] == unique_name for node in nodes_json.values()):
-                    unique_name = f"{original_name} {str(counter).zfill(3)}"
-                    counter += 1
-
-                if unique_name != original_name:
-                    print(
-                        f"Duplicate file found: {original_name}. Renamed to: {unique_name}"
-                    )
+    # Ensure thought names are unique, including against any nodes already loaded
+    name_allocator = util.UniqueNameAllocator(
+        case_insensitive=config.case_insensitive_file_names
+    )
+    for node in nodes_json.values():
+        name_allocator.reserve(node.name)
 
-                nodes_json[node_id] = {
-                    "ID": node_id,
-                    "Name": unique_name,
-                    "Kind": thought["Kind"],
-                    "TypeId": thought.get("TypeId", ""),
-                    "ACType": thought.get("ACType", ThoughtAccessType.PUBLIC),
-                    "Label": thought.get("Label", ""),
-                    "ForgottenDateTime": thought.get("ForgottenDateTime", ""),
-                    "Links": [],
-                    "Attachments": [],
-                }
-
-                # Add relationships
-                for link in links_json.get(node_id, []):
-                    nodes_json[node_id]["Links"].append(link)
-
-                # Add attachments
-                if thought["Kind"] == ThoughtKind.THOUGHT:
-                    for attachment in attachments_json.get(node_id, []):
-                        nodes_json[node_id]["Attachments"].append(attachment)
-
-                # Categorize nodes
-                if nodes_json[node_id]["Kind"] == ThoughtKind.TAG:
-                    list_of_tags[node_id] = {
-                        "ID": node_id,
-                        "Name": nodes_json[node_id]["Name"],
-                        "TagName": util.remove_invalid_character(
-                            thought["Name"], "_", invalid_file_characters
-                        ),
-                        "Links": nodes_json[node_id]["Links"],
-                    }
-                elif nodes_json[node_id]["Kind"] == ThoughtKind.TYPE:
-                    list_of_types[node_id] = {
-                        "ID": node_id,
-                        "Name": nodes_json[node_id]["Name"],
-                        "Links": nodes_json[node_id]["Links"],
-                    }
-                else:
-                    list_of_thoughts[node_id] = {
-                        "ID": node_id,
-                        "Name": nodes_json[node_id]["Name"],
-                    }
+    try:
+        for node in iter_thoughts(
+            thought_records, invalid_file_characters, name_allocator, attachments_json
+        ):
+            nodes_json[node.id] = node
+
+            # Categorize nodes
+            if node.kind == ThoughtKind.TAG:
+                list_of_tags[node.id] = node
+            elif node.kind == ThoughtKind.TYPE:
+                list_of_types[node.id] = node
+            else:
+                list_of_thoughts[node.id] = node
     except Exception as e:
         logging.error(f"Failed to process thoughts.json. Error: {e}")
         print(f"Failed to process thoughts.json. Error: {e}")
@@ -256,40 +212,105 @@ def clean_tag_names(list_of_tags):
     and removes leading underscores.
     """
     for node_id, node_data in list_of_tags.items():
-        if "TagName" in node_data:
+        if node_data.tag_name is not None:
             # Remove leading and trailing spaces, replace inline spaces with "_"
-            cleaned_tag_name = node_data["TagName"].strip().replace(" ", "_")
+            cleaned_tag_name = node_data.tag_name.strip().replace(" ", "_")
             # Remove leading underscores
             cleaned_tag_name = cleaned_tag_name.lstrip("_")
-            node_data["TagName"] = cleaned_tag_name
+            node_data.tag_name = cleaned_tag_name
 
 
-def build_breadcrumb_path(node_id, list_of_tags, current_path=None):
+def build_tag_parent_map(list_of_tags, links_json):
     """
-    Recursively build the breadcrumb path for a given node ID by traversing up the tree.
+    Build a child tag ID -> list of parent tag IDs map from the tags' TAGS_TO_TAGS links.
+    Parents are listed in the order they appear in list_of_tags.
     """
-    if current_path is None:
-        current_path = []
+    tag_parents = {}
+    for parent_id in list_of_tags:
+        for link in links_json.get(parent_id, []):
+            if link.meaning == LinkMeaning.TAGS_TO_TAGS:
+                parents = tag_parents.setdefault(link.id, [])
+                if parent_id not in parents:
+                    parents.append(parent_id)
+    return tag_parents
+
 
-    # Get the current node
-    current_node = list_of_tags.get(node_id)
-    if not current_node:
-        return current_path
+def resolve_tag_paths(list_of_tags, links_json, all_parent_paths=False):
+    """
+    Resolve the breadcrumb path (e.g. "grandparent/parent/tag") of every tag in list_of_tags.
 
-    # Prepend the current node's TagName to the path (already cleaned)
-    current_path.insert(0, current_node["TagName"])
+    The parent map is built once and each tag's paths are memoized, so every tag is
+    resolved once. A parent link that would close a cycle is logged and ignored, making
+    that tag the root of its path.
 
-    # Find parent nodes by checking which tags reference this node in their Links
-    for parent_id, parent_data in list_of_tags.items():
-        for link in parent_data.get("Links", []):
-            if (
-                link.get("ID") == node_id
-                and link.get("meaning_key") == LinkMeaning.TAGS_TO_TAGS
-            ):  # Parent-child relationship
-                # Recursively build the path for the parent node
-                return build_breadcrumb_path(parent_id, list_of_tags, current_path)
+    Args:
+        list_of_tags (dict): Tags keyed by ID, with cleaned TagNames.
+        links_json (LinkTable): The links of the brain.
+        all_parent_paths (bool): If True, a tag with several parent tags gets one path per
+            parent. If False only the first parent is followed.
 
-    return current_path
+    Returns:
+        dict: tag ID -> list of paths, with a single path unless all_parent_paths is set.
+    """
+    tag_parents = build_tag_parent_map(list_of_tags, links_json)
+    resolved_paths = {}
+    in_progress = set()
+
+    def parents_of(node_id):
+        parent_ids = tag_parents.get(node_id, [])
+        return parent_ids if all_parent_paths else parent_ids[:1]
+
+    # Depth-first with an explicit stack, so tag hierarchies of any depth are resolved.
+    # Each frame is [tag ID, its parent IDs, index of the next parent, parents followed]
+    for root_id in list_of_tags:
+        if root_id in resolved_paths:
+            continue
+        in_progress.add(root_id)
+        stack = [[root_id, parents_of(root_id), 0, []]]
+        while stack:
+            frame = stack[-1]
+            node_id, parent_ids, next_parent, followed_ids = frame
+            if next_parent < len(parent_ids):
+                parent_id = parent_ids[next_parent]
+                frame[2] += 1
+                if parent_id in in_progress:
+                    logging.warning(
+                        f"Tag hierarchy cycle: ignored link from tag {parent_id} to tag {node_id}"
+                    )
+                    continue
+                followed_ids.append(parent_id)
+                if parent_id not in resolved_paths:
+                    in_progress.add(parent_id)
+                    stack.append([parent_id, parents_of(parent_id), 0, []])
+                continue
+
+            # Every parent is resolved
+            tag_name = list_of_tags[node_id].tag_name
+            paths = [
+                f"{path}/{tag_name}"
+                for parent_id in followed_ids
+                for path in resolved_paths[parent_id]
+            ]
+            resolved_paths[node_id] = paths or [tag_name]
+            in_progress.discard(node_id)
+            stack.pop()
+    return resolved_paths
+
+
+def build_thought_tags_index(list_of_tags, links_json):
+    """
+    Build a reverse index of thought ID -> list of TagNames from the tags' TAG_TO_THOUGHT links,
+    so the tags for a thought can be looked up instead of scanning every tag for every thought.
+    Tags are listed in the same order as list_of_tags.
+    """
+    thought_tags = {}
+    for tag_id, tag_data in list_of_tags.items():
+        for link in links_json.get(tag_id, []):
+            if link.meaning == LinkMeaning.TAG_TO_THOUGHT:
+                thought_tags.setdefault(link.id, []).extend(
+                    tag_data.tag_paths or [tag_data.tag_name]
+                )
+    return thought_tags
 
 
 def process_tag_type_names(list_of_tags, types_prepend_text):
@@ -298,212 +319,911 @@ def process_tag_type_names(list_of_tags, types_prepend_text):
     If a TagName starts with the types_prepend_text string, it removes all occurrences
     of the types_prepend_text and prepends the result with types_prepend_text + "/".
     """
-    for node_id, node_data in list_of_tags.items():
-        tag_name = node_data.get("TagName", "")
+
+    def process_tag_name(tag_name):
         if tag_name.startswith(types_prepend_text):
             # Remove all occurrences of types_prepend_text
             updated_tag_name = tag_name.replace(types_prepend_text, "")
             # Prepend the result with types_prepend_text + "/"
-            node_data["TagName"] = f"{types_prepend_text}/{updated_tag_name}"
+            return f"{types_prepend_text}/{updated_tag_name}"
+        return tag_name
+
+    for node_id, node_data in list_of_tags.items():
+        node_data.tag_name = process_tag_name(node_data.tag_name or "")
+        if node_data.tag_paths is not None:
+            node_data.tag_paths = [
+                process_tag_name(tag_path) for tag_path in node_data.tag_paths
+            ]
+
+
+def related_thoughts(node_id, links_json, thought_names):
+    """
+    Returns the thoughts related to a thought by THOUGHT_TO_THOUGHT links in either direction,
+    as (Excalibrain field, name) pairs in the order of excalibrain_relation_fields. Only the
+    thought's own edges in the LinkTable are visited, and each related thought is listed once
+    per field.
+
+    Args:
+        node_id (str): The ID of the thought.
+        links_json (LinkTable): The links of the brain.
+        thought_names (dict): The names of the thoughts that get a markdown file by ID.
+
+    Returns:
+        list: (field, name) pairs, e.g. ("parent", "Projects").
+    """
+    relations = []
+    seen = set()
+    for field, relation, incoming in excalibrain_relation_fields:
+        for edge in links_json.edges(node_id, relation, incoming):
+            link = links_json.link(edge, incoming)
+            if link.meaning != LinkMeaning.THOUGHT_TO_THOUGHT:
+                continue
+            if link.id in thought_names and (field, link.id) not in seen:
+                seen.add((field, link.id))
+                relations.append((field, thought_names[link.id]))
+    return relations
+
+
+def render_markdown_note(
+    node_id,
+    node_data,
+    thought_tags,
+    relations,
+    export_source,
+    body_transforms,
+    notes_path,
+):
+    """
+    Render the full content of the markdown file for a thought: YAML frontmatter,
+    the Notes.md content with body_transforms applied, attachments and the related thoughts
+    from related_thoughts as parent/child/jump/sibling fields for Excalibrain.
+    notes_path is the path of the thought's Notes.md in export_source (from the export
+    index, in any case), or None if it has none.
+    """
+    note_parts = []
+
+    # Prepare YAML frontmatter data
+    yaml_data = {}
+
+    # Add tags
+    tags = thought_tags.get(node_id, [])
+    if tags:
+        yaml_data["tags"] = tags
+
+    # Add ACType
+    yaml_data["publish"] = (
+        "true" if node_data.ac_type == ThoughtAccessType.PUBLIC else "false"
+    )
+
+    # create a frontmatter key to indicated that this is a TheBrain export
+    yaml_data["exTheBrain"] = "yes"
+
+    # Add Labels as aliases
+    yaml_data["aliases"] = node_data.label
+
+    # YAML frontmatter
+    note_parts.append("---\n")
+    note_parts.append(mig_funcs.render_frontmatter(yaml_data))
+    note_parts.append("---\n\n")
+
+    # Add markdown attachments (Notes.md)
+    if notes_path is not None:
+        logging.info(f"Notes.md found at: {notes_path}")
+        with export_source.open_text(notes_path) as notes_file:
+            notes_content = notes_file.read()
+        # Convert links, images, checkboxes, ... in a single pass over the content
+        for body_transform in body_transforms:
+            notes_content = body_transform(notes_content)
+        note_parts.append(notes_content)
+        note_parts.append("\n\n")
+    else:
+        logging.warning(f"Notes.md not found for node: {node_id}")
+
+    # Append references to attachments
+    for attachment in node_data.attachments:
+        logging.info(f"Processing attachment: {attachment}")
+        if (
+            attachment.type == AttachmentType.INTERNAL_FILE
+            and attachment.source_type == AttachmentSourceType.ATTACHMENT
+            and attachment.note_type == AttachmentNoteType.ATTACHMENT
+        ):
+            note_parts.append(f"[[{attachment.name}]]\n")
+        elif (
+            attachment.type == AttachmentType.SUB_FILE
+            and attachment.source_type == AttachmentSourceType.ATTACHMENT
+            and attachment.note_type == AttachmentNoteType.ATTACHMENT
+        ):
+            note_parts.append(f"![[{attachment.name}]]\n")
+        elif (
+            attachment.type == AttachmentType.EXTERNAL_URL
+            and attachment.source_type == AttachmentSourceType.ATTACHMENT
+            and attachment.note_type == AttachmentNoteType.ATTACHMENT
+        ):
+            note_parts.append(f"[{attachment.name}]({attachment.location})\n")
+
+    # Add parent, child, jump and sibling links
+    for field, related_name in relations:
+        note_parts.append(f"{field}:: [[{related_name}]]\n")
+
+    return "".join(note_parts)
+
+
+def generate_markdown_note(
+    node_id,
+    node_data,
+    thought_tags,
+    links_json,
+    thought_names,
+    export_source,
+    output_dir,
+    body_transforms,
+    notes_info=None,
+    previous_entry=None,
+    track_state=False,
+    verify_hash=False,
+    track_links=False,
+):
+    """
+    Render and write the markdown file of a single thought.
+    notes_info is the path, size and mtime of the thought's Notes.md from the export index,
+    or None if it has none.
+    With track_state the note's fingerprint is computed, and the note is not rendered
+    at all if it matches previous_entry and the file exists (see generate_markdown_files).
+    With track_links the note's entry in the vault link index is taken from its rendered content.
+
+    Returns:
+        tuple: The outcome ("written", "identical", "unchanged" or "failed"), the
+            note's state entry, or None without track_state, and the note's link index entry,
+            or None if it was not rendered or without track_links.
+    """
+    # Create the markdown file name
+    file_name = f"{node_data.name}.md"
+    file_path = os.path.join(output_dir, file_name)
+
+    logging.info(f"Processing node: {node_id}, Name: {node_data.name}")
+
+    state_entry = None
+    try:
+        relations = related_thoughts(node_id, links_json, thought_names)
+        if track_state:
+            fingerprint = incremental.note_fingerprint(
+                node_data,
+                thought_tags.get(node_id, []),
+                relations,
+                notes_info["path"] if notes_info else None,
+                notes_info,
+                body_transforms,
+                verify_hash,
+                export_source,
+            )
+            state_entry = {"file": file_name, "fingerprint": fingerprint}
+            if previous_entry == state_entry and os.path.exists(file_path):
+                logging.info(f"Markdown file unchanged: {file_path}")
+                return "unchanged", state_entry, None
+
+        note_content = render_markdown_note(
+            node_id,
+            node_data,
+            thought_tags,
+            relations,
+            export_source,
+            body_transforms,
+            notes_info["path"] if notes_info else None,
+        )
+        outcome = "identical"
+        if util.write_file_if_changed(file_path, note_content):
+            logging.info(f"Markdown file created: {file_path}")
+            outcome = "written"
+        else:
+            logging.info(f"Markdown file identical, not rewritten: {file_path}")
+
+        link_entry = (
+            link_idx.index_entry(file_path, note_content) if track_links else None
+        )
+        return outcome, state_entry, link_entry
+
+    except Exception as e:
+        logging.error(f"Failed to create markdown file for {node_id}. Error: {e}")
+        print(f"Failed to create markdown file for {node_id}. Error: {e}")
+        # Render the note again next time
+        if state_entry is not None:
+            state_entry["fingerprint"] = None
+        return "failed", state_entry, None
+
+
+# Read-only indexes shared by the notes rendered in a worker process
+_worker_snapshot = None
+# Log records of a worker process, merged into the main log by the parent process
+_worker_log_handler = None
+
+
+def _init_markdown_worker(snapshot):
+    """
+    Initialise a worker process of generate_markdown_files with the snapshot of the indexes.
+    """
+    global _worker_snapshot, _worker_log_handler
+    _worker_snapshot = snapshot
+    _worker_log_handler = logging.handlers.BufferingHandler(capacity=sys.maxsize)
+    logging.root.handlers = [_worker_log_handler]
+    logging.root.setLevel(logging.INFO)
+
+
+def _generate_markdown_shard(shard):
+    """
+    Generate the notes of one shard in a worker process. A shard is its batch's
+    (thought_tags, links_json, thought_names), or None to use those of the snapshot,
+    and its notes.
+
+    Returns:
+        tuple: The (outcome, state entry, link entry) of each note and the log records
+            as (level, message).
+    """
+    indexes, notes = shard
+    thought_tags, links_json, thought_names = indexes or (
+        _worker_snapshot["thought_tags"],
+        _worker_snapshot["links_json"],
+        _worker_snapshot["thought_names"],
+    )
+    results = [
+        generate_markdown_note(
+            node_id,
+            node_data,
+            thought_tags,
+            links_json,
+            thought_names,
+            _worker_snapshot["export_source"],
+            _worker_snapshot["output_dir"],
+            _worker_snapshot["body_transforms"],
+            notes_info,
+            previous_entry,
+            _worker_snapshot["track_state"],
+            _worker_snapshot["verify_hash"],
+            _worker_snapshot["track_links"],
+        )
+        for node_id, node_data, notes_info, previous_entry in notes
+    ]
+    log_records = [
+        (record.levelno, record.getMessage()) for record in _worker_log_handler.buffer
+    ]
+    _worker_log_handler.buffer.clear()
+    return results, log_records
 
 
 def generate_markdown_files(
-    nodes_json, list_of_tags, links_json, thoughts_json, source_dir, output_dir
+    nodes_json,
+    thought_tags,
+    links_json,
+    thought_names,
+    export_source,
+    output_dir,
+    body_transforms,
+    notes_state_path=None,
+    verify_hash=False,
+    workers=1,
+    export_index=None,
+    link_index_path=None,
+    store=None,
+    journal=None,
 ):
     """
     Generate markdown files for high-level objects in nodes_json with Kind == THOUGHT,
     excluding those with Thought Kind equal to 2.
+    Each note is fully rendered, including body_transforms, before it is written once.
+
+    With a notes_state_path the migration is incremental: a fingerprint of each note's inputs
+    is stored in that file, only notes whose fingerprint changed are rendered again, and the
+    files of thoughts that no longer exist are deleted (see incremental_migration).
+    verify_hash fingerprints Notes.md by content instead of size and mtime.
+
+    A note whose rendered content is identical to its existing file is not rewritten.
+
+    With more than one worker the thoughts are split into shards that are rendered by a
+    pool of processes, each with a read-only snapshot of the tag, link and name indexes.
+    Their results and log messages are merged in order.
+
+    With a store (see migration_store) nodes_json, thought_tags, links_json and thought_names
+    are not used: the thoughts are read from the store in batches, each with the indexes of
+    its own notes, and rendered batch by batch (with workers, a batch per shard).
+
+    Notes.md files are read from export_source, an export directory or zip archive (see
+    export_source). export_index is the index from export_source.scan(), used to find each
+    thought's Notes.md without checking the export; the export is scanned if it is None.
+
+    With a link_index_path the vault link index (see vault_link_index) is updated: the links of
+    each rendered note are taken from its content, and only other notes that changed since the
+    last run are read.
+
+    With a journal (see migration_checkpoint) each note is recorded once its file is written,
+    and the notes the journal recorded before a migration was interrupted are not rendered
+    again: their state and link index entries are taken from the journal.
+
+    Returns:
+        dict: The number of files written, identical (rendered but not rewritten),
+            unchanged (not rendered, incremental only), resumed (written before the
+            migration was interrupted), deleted and failed, and the outcome of each file
+            by file name.
     """
     logging.info("Generating markdown files...")
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
-    for node_id, node_data in nodes_json.items():
-        # Skip nodes with Thought Kind equal to 2
-        if node_data["Kind"] == ThoughtKind.TYPE:
-            logging.info(f"Skipped node: {node_id} with Kind == 2")
-            continue
+    if export_index is None:
+        export_index = export_source.scan()
+
+    summary = {
+        "written": 0,
+        "identical": 0,
+        "unchanged": 0,
+        "resumed": 0,
+        "deleted": 0,
+        "failed": 0,
+        "files": {},
+    }
+    track_state = bool(notes_state_path)
+    previous_state = (
+        incremental.load_notes_state(notes_state_path) if track_state else {}
+    )
+    notes_state = {}
+    track_links = bool(link_index_path)
+    link_index = link_idx.load_link_index(link_index_path) if track_links else {}
+    completed_notes = journal.completed("notes") if journal is not None else {}
+
+    def record_results(notes, results):
+        for (node_id, node_data, _, _), (outcome, state_entry, link_entry) in zip(
+            notes, results
+        ):
+            summary[outcome] += 1
+            summary["files"][f"{node_data.name}.md"] = outcome
+            if state_entry is not None:
+                notes_state[node_id] = state_entry
+            if link_entry is not None:
+                link_index[f"{node_data.name}.md"] = link_entry
+            if journal is not None and outcome not in ("failed", "resumed"):
+                journal.record(
+                    "notes", node_id, [f"{node_data.name}.md", state_entry, link_entry]
+                )
 
-        # Skip nodes with a non-empty ForgottenDateTime
-        if node_data["ForgottenDateTime"]:
-            logging.info(f"Skipped node: {node_id} with non-empty ForgottenDateTime")
-            continue
+    def notes_to_generate(nodes):
+        """
+        Returns the notes to render of (node ID, Thought) pairs, with the info of their
+        Notes.md and their state from the previous run. Notes completed before the
+        migration was interrupted are recorded as resumed instead.
+        """
+        notes = []
+        for node_id, node_data in nodes:
+            # Skip nodes with Thought Kind equal to 2
+            if node_data.kind == ThoughtKind.TYPE:
+                logging.info(f"Skipped node: {node_id} with Kind == 2")
+                continue
+
+            # Skip nodes with a non-empty ForgottenDateTime
+            if node_data.forgotten_date_time:
+                logging.info(
+                    f"Skipped node: {node_id} with non-empty ForgottenDateTime"
+                )
+                continue
 
-        # Only process high-level objects with Kind == THOUGHT
-        if node_data["Kind"] != ThoughtKind.THOUGHT:
-            continue
+            # Only process high-level objects with Kind == THOUGHT
+            if node_data.kind != ThoughtKind.THOUGHT:
+                continue
 
-        # Create the markdown file name
-        file_name = f"{node_data['Name']}.md"
-        file_path = os.path.join(output_dir, file_name)
-
-        logging.info(f"Processing node: {node_id}, Name: {node_data['Name']}")
-
-        try:
-            with open(file_path, "w", encoding="utf-8") as md_file:
-                # Prepare YAML frontmatter data
-                yaml_data = {}
-
-                # Add tags
-                tags = [
-                    tag_data["TagName"]
-                    for tag_data in list_of_tags.values()
-                    for link in tag_data.get("Links", [])
-                    if link.get("ID") == node_id
-                    and link.get("meaning_key") == LinkMeaning.TAG_TO_THOUGHT
-                ]
-                if tags:
-                    yaml_data["tags"] = tags
-
-                # Add ACType
-                if "ACType" in node_data:
-                    yaml_data["publish"] = (
-                        "true"
-                        if node_data["ACType"] == ThoughtAccessType.PUBLIC
-                        else "false"
-                    )
+            completed = completed_notes.get(node_id)
+            if (
+                completed
+                and completed[0] == f"{node_data.name}.md"
+                and os.path.exists(os.path.join(output_dir, completed[0]))
+            ):
+                record_results(
+                    [(node_id, node_data, None, None)], [("resumed", *completed[1:])]
+                )
+                continue
+
+            notes.append(
+                (
+                    node_id,
+                    node_data,
+                    export_index.get(node_id, {}).get("notes"),
+                    previous_state.get(node_id),
+                )
+            )
+        return notes
 
-                # create a frontmatter key to indicated that this is a TheBrain export
-                yaml_data["exTheBrain"] = "yes"
-
-                # Add Labels as aliases
-                if "Label" in node_data:
-                    yaml_data["aliases"] = node_data.get("Label")
-
-                # Write YAML frontmatter
-                md_file.write("---\n")
-                yaml.dump(yaml_data, md_file, default_flow_style=False)
-                md_file.write("---\n\n")
-
-                # Add markdown attachments (Notes.md)
-                notes_path = os.path.join(source_dir, node_id, "Notes.md")
-                logging.info(f"Looking for Notes.md at: {notes_path}")
-                if os.path.exists(notes_path):
-                    logging.info(f"Notes.md found at: {notes_path}")
-                    with open(notes_path, "r", encoding="utf-8") as notes_file:
-                        notes_content = notes_file.read()
-                        # Replace [****](brain://****) with [[****]]
-                        notes_content = re.sub(
-                            r"\[([^\]]+)\]\(brain://[^\)]+\)", r"[[\1]]", notes_content
-                        )
-                        # Replace local image references with ![[filename|200]]
-                        notes_content = re.sub(
-                            r"!\[.*?\]\(\.data/md-images/([^/]+\.(?:png|jpg|jpeg|gif|bmp|tiff|svg))(?:#.*)?\)",
-                            r"\n![[\1|200]]",
-                            notes_content,
-                        )
-                        md_file.write(notes_content)
-                        md_file.write("\n\n")
-                else:
-                    logging.warning(f"Notes.md not found for node: {node_id}")
-
-                # Append references to attachments
-                for attachment in node_data.get("Attachments", []):
-                    logging.info(f"Processing attachment: {attachment}")
-                    if (
-                        attachment["type"] == AttachmentType.INTERNAL_FILE
-                        and attachment["source_type"] == AttachmentSourceType.ATTACHMENT
-                        and attachment["note_type"] == AttachmentNoteType.ATTACHMENT
-                    ):
-                        md_file.write(f"[[{attachment['name']}]]\n")
-                    elif (
-                        attachment["type"] == AttachmentType.SUB_FILE
-                        and attachment["source_type"] == AttachmentSourceType.ATTACHMENT
-                        and attachment["note_type"] == AttachmentNoteType.ATTACHMENT
-                    ):
-                        md_file.write(f"![[{attachment['name']}]]\n")
-                    elif (
-                        attachment["type"] == AttachmentType.EXTERNAL_URL
-                        and attachment["source_type"] == AttachmentSourceType.ATTACHMENT
-                        and attachment["note_type"] == AttachmentNoteType.ATTACHMENT
-                    ):
-                        md_file.write(
-                            f"[{attachment['name']}]({attachment['location']})\n"
+    # Batches of notes with the (thought_tags, links_json, thought_names) they are rendered
+    # from: all notes with the indexes in memory (None), or batches read from the store
+    if store is None:
+        batches = [(None, notes_to_generate(nodes_json.items()))]
+    else:
+        batches = (
+            (indexes, notes_to_generate(nodes))
+            for nodes, indexes in store.iter_render_batches()
+        )
+
+    if workers > 1:
+        snapshot = {
+            "thought_tags": thought_tags,
+            "links_json": links_json,
+            "thought_names": thought_names,
+            "export_source": export_source,
+            "output_dir": output_dir,
+            "body_transforms": body_transforms,
+            "track_state": track_state,
+            "verify_hash": verify_hash,
+            "track_links": track_links,
+        }
+
+        def collect(notes, future):
+            shard_results, log_records = future.result()
+            for level, message in log_records:
+                logging.log(level, message)
+            record_results(notes, shard_results)
+
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_markdown_worker,
+            initargs=(snapshot,),
+        ) as executor:
+            # Shards are submitted as the batches are read, with a bounded number in flight
+            pending = deque()
+            for indexes, notes in batches:
+                # Several shards per worker to even out notes of different sizes
+                shard_size = (
+                    max(1, -(-len(notes) // (workers * 8)))
+                    if store is None
+                    else max(1, len(notes))
+                )
+                for i in range(0, len(notes), shard_size):
+                    shard = notes[i : i + shard_size]
+                    pending.append(
+                        (
+                            shard,
+                            executor.submit(_generate_markdown_shard, (indexes, shard)),
                         )
+                    )
+                    while len(pending) > workers * 4:
+                        collect(*pending.popleft())
+            while pending:
+                collect(*pending.popleft())
+    else:
+        for indexes, notes in batches:
+            batch_thought_tags, batch_links_json, batch_thought_names = indexes or (
+                thought_tags,
+                links_json,
+                thought_names,
+            )
+            # Each note is recorded as it is written, e.g. in the progress journal
+            for note in notes:
+                node_id, node_data, notes_info, previous_entry = note
+                result = generate_markdown_note(
+                    node_id,
+                    node_data,
+                    batch_thought_tags,
+                    batch_links_json,
+                    batch_thought_names,
+                    export_source,
+                    output_dir,
+                    body_transforms,
+                    notes_info,
+                    previous_entry,
+                    track_state,
+                    verify_hash,
+                    track_links,
+                )
+                record_results([note], [result])
 
-                # Add child and jump links based on links_json
-                if node_id in links_json:
-                    for link in links_json[node_id]:
-                        if link.get("meaning_key") == LinkMeaning.THOUGHT_TO_THOUGHT:
-                            related_id = link.get("ID")
-                            relation = link.get("relation_type")
-                            if related_id in thoughts_json:
-                                related_name = thoughts_json[related_id]["Name"]
-                                if (
-                                    relation == LinkRelation.PARENT_TO_CHILD
-                                ):  # Child link
-                                    md_file.write(f"child:: [[{related_name}]]\n")
-                                elif relation == LinkRelation.JUMP:  # Jump link
-                                    md_file.write(f"jump:: [[{related_name}]]\n")
+    if track_state:
+        summary["deleted"] = incremental.delete_removed_notes(
+            previous_state, notes_state, output_dir
+        )
+        incremental.save_notes_state(notes_state, notes_state_path)
 
-            logging.info(f"Markdown file created: {file_path}")
+    if track_links:
+        # Index the attachments, and notes not rendered by this run if they changed
+        notes_read = link_idx.update_link_index(output_dir, link_index)
+        logging.info(f"Link index updated, {notes_read} notes not rendered were read")
+        link_idx.save_link_index(link_index, link_index_path)
 
-        except Exception as e:
-            logging.error(f"Failed to create markdown file for {node_id}. Error: {e}")
-            print(f"Failed to create markdown file for {node_id}. Error: {e}")
+    return summary
 
 
-if config.types_to_tags:
-    mig_funcs.convert_types_to_tags(
-        thoughts_path, links_path, output_directory + "/originals"
+def main():
+    parser = argparse.ArgumentParser(
+        description="Migrate a JSON export of The Brain to an Obsidian vault."
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=config.markdown_workers,
+        help="Number of processes generating markdown files (default: markdown_workers in enduser_config.py)",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Resume an interrupted migration: the vault is not cleared and attachments and notes completed before the interruption are skipped",
+    )
+    parser.add_argument(
+        "--profile-report",
+        help="Path of the profile report (default: <log file>_profile.json next to the log file)",
+    )
+    args = parser.parse_args()
+
+    # Ensure the output directory exists
+    if not os.path.exists(output_directory):
+        os.makedirs(output_directory)
+
+    # Configure logging
+    # Set up logging
+    log_file = util.setup_logging(log_directory="./logs", log_prefix="migration")
+    print(f"Log file created: {log_file}")
+
+    # Initialize dictionaries
+    nodes_json = {}
+    list_of_thoughts = {}
+    list_of_tags = {}
+    list_of_types = {}
+    links_json = LinkTable()
+    attachments_json = {}
+
+    # The export is read from its directory, or straight from its zip archive
+    export_source = export_src.open_export_source(TheBrain_export_dir)
+
+    # A checkpoint is only resumed for the same export files and settings
+    checkpoint_header = checkpoint.journal_header(
+        export_source,
+        TheBrain_JSON_files,
+        {
+            name: value
+            for name, value in vars(config).items()
+            if not name.startswith("_")
+        },
+    )
+    completed = (
+        checkpoint.load_journal(checkpoint_path, checkpoint_header)
+        if args.resume
+        else None
+    )
+    if completed is not None:
+        message = (
+            f"Resuming the interrupted migration from {checkpoint_path}: "
+            f"{len(completed.get('attachments', {}))} attachments and "
+            f"{len(completed.get('notes', {}))} notes already done"
+        )
+        logging.info(message)
+        print(message)
+    elif args.resume:
+        message = "No checkpoint to resume for this export and these settings, starting a new migration"
+        logging.warning(message)
+        print(message)
+
+    # Time each stage of the migration, see the profile report next to the log file
+    profiler = stage_profiler.StageProfiler(
+        config.profile_with_cprofile, config.profile_with_tracemalloc
     )
 
-create_links_json_dic(links_path, links_json)
-create_attachments_json_dic(attachments_path, attachments_json)
-create_thoughts_json_dic_with_links_attachments(
-    thoughts_path,
-    invalid_file_characters,
-    nodes_json,
-    list_of_thoughts,
-    list_of_tags,
-    list_of_types,
-    links_json,
-    attachments_json,
-)
-
-clean_tag_names(list_of_tags)
-
-# Update the "TagName" property for each node
-for node_id, node_data in list_of_tags.items():
-    breadcrumb_path = build_breadcrumb_path(node_id, list_of_tags)
-    # Join the breadcrumb path with "/" and update the "TagName"
-    node_data["TagName"] = "/".join(breadcrumb_path)
+    # Clear the obsidian vault directory if required
+    with profiler.stage("clear"):
+        if completed is not None:
+            # The vault and the parsed brain are kept to continue the migration
+            print(
+                f"Resumed migration, the directory is not cleared: {obsidian_vault_directory}"
+            )
+        elif config.empty_obsidian_vault_dir_prior_to_running_the_script:
+            # Check if the directory exists before clearing it
+            if os.path.exists(obsidian_vault_directory):
+                # Clear the content of the obsidian vault directory, excluding ".obsidian"
+                # retain obsidian config files
+                vault_items_to_keep = [".obsidian"]
+                if config.incremental_attachment_sync:
+                    # Attachments are synced, only changes are copied or deleted
+                    vault_items_to_keep += ["data", os.path.basename(state_directory)]
+                if config.incremental_migration:
+                    # Notes are updated in place, only changed notes are rewritten or deleted
+                    print(
+                        f"Incremental migration, the directory is not cleared: {obsidian_vault_directory}"
+                    )
+                else:
+                    util.clear_folder(obsidian_vault_directory, vault_items_to_keep)
+                    print(
+                        f"Cleared content of the directory: {obsidian_vault_directory}, excluding .obsidian folder."
+                    )
+            else:
+                # Create the directory if it doesn't exist
+                os.makedirs(obsidian_vault_directory)
+                logging.info(f"Created directory: {obsidian_vault_directory}")
+                print(f"Created directory: {obsidian_vault_directory}")
+
+        # clear down the obsidian vault directory
+        if completed is None:
+            util.clear_folder(output_directory, exclude_list=["/.obsidian"])
+
+    # Record the attachments and notes completed from here on
+    journal = checkpoint.ProgressJournal(checkpoint_path, checkpoint_header, completed)
+
+    # TheBrain JSON files are streamed straight into the dictionaries below; refactored
+    # (well-formatted) copies are only saved in the output directory for debugging
+    if config.save_TB_Refactored_json_files:
+        with profiler.stage("serialise"):
+            util.Serialise_TBjson_files(
+                [
+                    export_source.file_path(file_name)
+                    for file_name in TheBrain_JSON_files
+                ],
+                output_directory,
+                export_source,
+            )
+
+    # create subdirectories in the obsidian vault directory
+
+    destination_dir_documents = os.path.join(obsidian_vault_directory, "data/documents")
+    destination_dir_embedded_images = os.path.join(
+        obsidian_vault_directory, "data/embedded images"
+    )
+    destination_dir_document_folders = os.path.join(
+        obsidian_vault_directory, "data/document_folders"
+    )
 
-# remove repetitive occurances of the prend text for Types and add a single prepend text as a prefix
-if config.types_to_tags:
-    process_tag_type_names(list_of_tags, config.types_prepend_text)
+    for directory in [
+        destination_dir_documents,
+        destination_dir_embedded_images,
+        destination_dir_document_folders,
+    ]:
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+            logging.info(f"Created directory: {directory}")
+        else:
+            logging.info(f"Directory already exists: {directory}")
+
+    # Index the thought folders of the export directory or zip archive once for all later stages
+    with profiler.stage("export_scan") as counts:
+        export_index = export_source.scan()
+        counts["folders"] = len(export_index)
+
+    # move attacchment in the export Brain directory to the obsidian vault directory
+    with profiler.stage("attachments") as counts:
+        copy_summary, copy_jobs = util.process_exported_attachments(
+            export_source,
+            destination_dir_documents,
+            destination_dir_embedded_images,
+            destination_dir_document_folders,
+            config.attachment_copy_mode,
+            config.attachment_copy_workers,
+            attachments_manifest_path if config.incremental_attachment_sync else None,
+            config.attachment_sync_verify_hash,
+            export_index,
+            journal,
+        )
+        counts["files"] = copy_summary["files_copied"]
+        counts["bytes"] = copy_summary["bytes_copied"]
 
-# Save the updated tags_json back to a file
-output_path = "./JSONS/updated_tags_json.json"
-with open(output_path, "w", encoding="utf-8") as outfile:
-    json.dump(list_of_tags, outfile, indent=4)
+    link_records = util.iter_TBjson_records(
+        export_source.file_path(TheBrain_links_file), export_source
+    )
+    thought_records = util.iter_TBjson_records(
+        export_source.file_path(TheBrain_thoughts_file), export_source
+    )
 
+    # Convert Types to Tags as the records are streamed in, so the conversion is timed
+    # as part of indexing the links and thoughts
+    if config.types_to_tags:
+        link_records = mig_funcs.convert_type_links_to_tags(link_records)
+        thought_records = mig_funcs.convert_type_thoughts_to_tags(thought_records)
 
-# Serialize dictionaries to JSON files
+    attachment_records = util.iter_TBjson_records(
+        export_source.file_path(TheBrain_attachments_file), export_source
+    )
 
+    # With the SQLite store the records are written to disk instead of the dictionaries.
+    # A store completed before the migration was interrupted is opened again as it is
+    store_resumed = store_path in journal.completed("store") and os.path.exists(
+        store_path
+    )
+    store = (
+        migration_store.open_store(store_path, reopen=store_resumed)
+        if config.use_sqlite_store
+        else None
+    )
 
-# Call the function with the output files
-output_files = {
-    "./JSONS/nodes_json.json": nodes_json,
-    "./JSONS/thoughts_json.json": list_of_thoughts,
-    "./JSONS/tags_json.json": list_of_tags,
-    "./JSONS/types_json.json": list_of_types,
-    "./JSONS/links_json.json": links_json,
-}
-util.serialise_dicts_to_json(output_files)
+    if store is not None and store_resumed:
+        # Its tags were resolved and saved before the interruption
+        thought_tags = None
+    else:
+        with profiler.stage("links_index") as counts:
+            if store is not None:
+                counts["links"] = store.add_links(link_records)
+            else:
+                create_links_json_dic(link_records, links_json)
+                counts["links"] = len(links_json)
+        with profiler.stage("attachments_index") as counts:
+            if store is not None:
+                counts["attachments"] = store.add_attachments(attachment_records)
+            else:
+                create_attachments_json_dic(attachment_records, attachments_json)
+                counts["attachments"] = sum(
+                    len(attachments) for attachments in attachments_json.values()
+                )
+        with profiler.stage("thoughts_index") as counts:
+            if store is not None:
+                try:
+                    name_allocator = migration_store.StoreNameAllocator(
+                        store, config.case_insensitive_file_names
+                    )
+                    counts["thoughts"] = store.add_thoughts(
+                        iter_thoughts(
+                            thought_records,
+                            invalid_file_characters,
+                            name_allocator,
+                            attachments_json,
+                        )
+                    )
+                    name_allocator.flush()
+                except Exception as e:
+                    logging.error(f"Failed to process thoughts.json. Error: {e}")
+                    print(f"Failed to process thoughts.json. Error: {e}")
+            else:
+                create_thoughts_json_dic_with_links_attachments(
+                    thought_records,
+                    invalid_file_characters,
+                    nodes_json,
+                    list_of_thoughts,
+                    list_of_tags,
+                    list_of_types,
+                    attachments_json,
+                )
+                counts["thoughts"] = len(nodes_json)
+
+        with profiler.stage("breadcrumbs") as counts:
+            # The tags and the links of tags are small enough to resolve in memory
+            if store is not None:
+                list_of_tags = store.tags()
+                tag_links = store.tag_links()
+            else:
+                tag_links = links_json
+            clean_tag_names(list_of_tags)
+
+            # Update the "TagName" property for each node with its breadcrumb path
+            tag_paths = resolve_tag_paths(
+                list_of_tags, tag_links, config.tags_emit_all_parent_paths
+            )
+            for node_id, node_data in list_of_tags.items():
+                node_data.tag_name = tag_paths[node_id][0]
+                if config.tags_emit_all_parent_paths:
+                    node_data.tag_paths = tag_paths[node_id]
+
+            # remove repetitive occurances of the prend text for Types and add a single prepend text as a prefix
+            if config.types_to_tags:
+                process_tag_type_names(list_of_tags, config.types_prepend_text)
+
+            # Index the final tag names by the thoughts they are linked to, or store them
+            # for the render batches to look up
+            if store is not None:
+                store.save_tags(list_of_tags)
+                thought_tags = None
+            else:
+                thought_tags = build_thought_tags_index(list_of_tags, links_json)
+            counts["tags"] = len(list_of_tags)
+
+        if store is not None:
+            journal.record("store", store_path)
+
+    if store is not None:
+        # The store replaces the debug JSON dumps
+        logging.info(f"Parsed brain stored in: {store_path}")
+        print(f"Parsed brain stored in: {store_path}")
+    else:
+        with profiler.stage("json_dumps") as counts:
+            # Save the updated tags_json back to a file
+            output_path = "./JSONS/updated_tags_json.json"
+            with open(output_path, "w", encoding="utf-8") as outfile:
+                json.dump(
+                    records_to_json(list_of_tags, links_json, "tag"), outfile, indent=4
+                )
 
-print("Generating Markdown files...")
-generate_markdown_files(
-    nodes_json,
-    list_of_tags,
-    links_json,
-    list_of_thoughts,
-    TheBrain_export_dir,
-    obsidian_vault_directory,
-)
+            # Serialize dictionaries to JSON files
+
+            # Call the function with the output files
+            # The debug dumps are built from the records one file at a time
+            output_files = {
+                "./JSONS/nodes_json.json": lambda: records_to_json(
+                    nodes_json, links_json, "node"
+                ),
+                "./JSONS/thoughts_json.json": lambda: records_to_json(
+                    list_of_thoughts, links_json, "thought"
+                ),
+                "./JSONS/tags_json.json": lambda: records_to_json(
+                    list_of_tags, links_json, "tag"
+                ),
+                "./JSONS/types_json.json": lambda: records_to_json(
+                    list_of_types, links_json, "type"
+                ),
+                "./JSONS/links_json.json": links_json.to_json,
+            }
+            util.serialise_dicts_to_json(output_files)
+            counts["files"] = len(output_files) + 1
+
+    print("Generating Markdown files...")
+    thought_names = (
+        None
+        if store is not None
+        else {
+            node_id: node_data.name for node_id, node_data in list_of_thoughts.items()
+        }
+    )
+    link_index_path = (
+        link_idx.link_index_path(obsidian_vault_directory)
+        if config.save_vault_link_index
+        else None
+    )
+    # Checkboxes are converted by the body transforms while the notes are generated
+    with profiler.stage("generation") as counts:
+        markdown_summary = generate_markdown_files(
+            nodes_json,
+            thought_tags,
+            links_json,
+            thought_names,
+            export_source,
+            obsidian_vault_directory,
+            notes_body_transforms,
+            notes_state_path if config.incremental_migration else None,
+            config.incremental_migration_verify_hash,
+            args.workers,
+            export_index,
+            link_index_path,
+            store,
+            journal,
+        )
+        counts["notes"] = len(markdown_summary["files"])
+    summary_message = (
+        f"Markdown files: {markdown_summary['written']} written, "
+        f"{markdown_summary['identical']} identical and not rewritten, "
+        f"{markdown_summary['unchanged']} unchanged since the last run, "
+        f"{markdown_summary['resumed']} written before the resume, "
+        f"{markdown_summary['deleted']} deleted, {markdown_summary['failed']} failed"
+    )
+    logging.info(summary_message)
+    print(summary_message)
+
+    print("Markdown files generated successfully.")
+
+    # Check that the thoughts and attachments of the export arrived in the vault
+    if config.verify_migration_integrity:
+        with profiler.stage("integrity_check"):
+            integrity_report = integrity.verify_migration(
+                export_index,
+                nodes_json if store is None else store,
+                copy_jobs,
+                copy_summary,
+                {
+                    "attachments": destination_dir_documents,
+                    "md_images": destination_dir_embedded_images,
+                    "folder_files": destination_dir_document_folders,
+                },
+                markdown_summary,
+                obsidian_vault_directory,
+                link_index_path,
+                config.integrity_check_verify_checksums,
+                config.attachment_copy_workers,
+                export_source,
+            )
+            integrity.save_report(
+                integrity_report,
+                os.path.join(output_directory, "integrity_report.json"),
+            )
+
+    # Keep the checkpoint while files failed, so a resume only retries those
+    if markdown_summary["failed"] or copy_summary["files_failed"]:
+        journal.close()
+        message = f"Some files failed, run with --resume to retry only those (checkpoint: {checkpoint_path})"
+        logging.warning(message)
+        print(message)
+    else:
+        journal.remove()
 
-# Refactor generated markdown files to replace checkboxes
-mig_funcs.refactor_check_boxes(obsidian_vault_directory)
+    export_source.close()
+    if store is not None:
+        store.close()
+    profiler.save(
+        args.profile_report or f"{os.path.splitext(log_file)[0]}_profile.json"
+    )
 
 
-print("Markdown files generated successfully.")
+if __name__ == "__main__":
+    main()
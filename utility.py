@@ -2,7 +2,9 @@ import os
 import shutil
 import logging
 import json
+import unicodedata
 from datetime import datetime
+import attachment_copier
 
 
 def remove_invalid_character(text_string, replace_character, invalid_characters):
@@ -29,6 +31,82 @@ def remove_invalid_character(text_string, replace_character, invalid_characters)
     return text_string.strip()
 
 
+class UniqueNameAllocator:
+    """
+    Hands out unique file names, appending a zero-padded counter (e.g. "Notes 001")
+    when a name has already been used.
+
+    Used names are kept in a set and the next counter to try is remembered per base
+    name, so each allocation is O(1) on average instead of a scan of every name
+    handed out so far. Subclasses can keep the used names elsewhere by overriding
+    _is_used and _use (see migration_store.StoreNameAllocator).
+
+    Args:
+        case_insensitive (bool): If True, names that differ only by case or Unicode
+            normalization (NFC/NFD) are treated as the same name, as they are on
+            Windows and macOS filesystems.
+    """
+
+    def __init__(self, case_insensitive=False):
+        self.case_insensitive = case_insensitive
+        self._used_names = set()
+        self._next_counter = {}
+
+    def _key(self, name):
+        if self.case_insensitive:
+            return unicodedata.normalize("NFC", name).casefold()
+        return name
+
+    def _is_used(self, key):
+        return key in self._used_names
+
+    def _use(self, key):
+        self._used_names.add(key)
+
+    def reserve(self, name):
+        """
+        Mark a name as used without allocating it, e.g. for files already in the vault.
+        """
+        self._use(self._key(name))
+
+    def allocate(self, original_name):
+        """
+        Return original_name if it is free, otherwise the first free
+        "{original_name} 001", "{original_name} 002", ... and mark it as used.
+
+        Args:
+            original_name (str): The cleaned name to allocate.
+
+        Returns:
+            str: The unique name.
+        """
+        base_key = self._key(original_name)
+        unique_name = original_name
+        key = base_key
+        # Resume counting where the last collision on this base name stopped; every
+        # name below that counter is already taken, so the result matches a restart at 1.
+        counter = self._next_counter.get(base_key, 1)
+        while self._is_used(key):
+            unique_name = f"{original_name} {str(counter).zfill(3)}"
+            key = self._key(unique_name)
+            counter += 1
+
+        if counter > 1:
+            self._next_counter[base_key] = counter
+        self._use(key)
+        return unique_name
+
+    def allocate_many(self, original_names):
+        """
+        Allocate names in order, as allocate does one by one. Subclasses that keep the
+        used names elsewhere can look the batch up at once.
+
+        Returns:
+            list: The unique names.
+        """
+        return [self.allocate(name) for name in original_names]
+
+
 def clear_folder(folder_path, exclude_list=None):
     """
     A utility function to check if a folder has content and delete the content if it exists,
@@ -70,13 +148,37 @@ def clear_folder(folder_path, exclude_list=None):
         print(f"Folder did not exist: {folder_path}. It will be created if needed.")
 
 
-def Serialise_TBjson_files(input_files, output_directory):
+def iter_TBjson_records(input_file_path, export_source=None):
+    """
+    Streams the records of one of TheBrain's line-delimited (pseudo-JSON) export files,
+    parsing one line at a time so the whole file is never held in memory.
+
+    Args:
+        input_file_path (str): Path to thoughts.json, links.json or attachments.json.
+        export_source: The export_source the path is from (e.g. a zip archive), or None
+            for a file on disk.
+
+    Yields:
+        dict: One thought, link or attachment record per line. Blank lines are skipped.
+    """
+    if export_source is None:
+        infile = open(input_file_path, "r", encoding="utf-8-sig")  # Handle BOM
+    else:
+        infile = export_source.open_text(input_file_path, encoding="utf-8-sig")
+    with infile:
+        for line in infile:
+            if line.strip():
+                yield json.loads(line)
+
+
+def Serialise_TBjson_files(input_files, output_directory, export_source=None):
     """
     Converts pseudo-JSON files to properly formatted JSON arrays and saves them to the output directory.
 
     Args:
         input_files (list): List of input file paths.
         output_directory (str): Path to the output directory.
+        export_source: The export_source the paths are from, or None for files on disk.
     """
     # Ensure the output directory exists
     if not os.path.exists(output_directory):
@@ -86,16 +188,12 @@ def Serialise_TBjson_files(input_files, output_directory):
     for input_file_path in input_files:
         try:
             # Extract the original filename and prepend "TB_Refactored_"
-            original_filename = os.path.basename(input_file_path)
+            original_filename = os.path.basename(input_file_path.replace("/", os.sep))
             output_file_name = f"TB_Refactored_{original_filename}"
             output_file_path = os.path.join(output_directory, output_file_name)
 
             # Read the pseudo-JSON file and convert it to a proper JSON array
-            with open(
-                input_file_path, "r", encoding="utf-8-sig"
-            ) as infile:  # Handle BOM
-                lines = infile.readlines()
-                json_data = [json.loads(line) for line in lines]
+            json_data = list(iter_TBjson_records(input_file_path, export_source))
 
             # Write the properly formatted JSON array to the output file
             with open(output_file_path, "w", encoding="utf-8") as outfile:
@@ -106,6 +204,35 @@ def Serialise_TBjson_files(input_files, output_directory):
             print(f"An error occurred while processing {input_file_path}: {e}")
 
 
+def write_file_if_changed(file_path, content, encoding="utf-8"):
+    """
+    Writes text to a file only if the file does not already have exactly that content,
+    so unchanged files keep their modified date and are not re-synced or re-indexed.
+    The sizes are compared first and the bytes only if the sizes match.
+
+    Args:
+        file_path (str): The file to write.
+        content (str): The text to write, with "\n" line endings as for a file opened with "w".
+        encoding (str): The text encoding.
+
+    Returns:
+        bool: True if the file was written, False if it was already identical.
+    """
+    # Encode as text mode would, with the platform's line endings
+    data = content.replace("\n", os.linesep).encode(encoding)
+    try:
+        if os.stat(file_path).st_size == len(data):
+            with open(file_path, "rb") as f:
+                if f.read() == data:
+                    return False
+    except FileNotFoundError:
+        pass
+
+    with open(file_path, "wb") as f:
+        f.write(data)
+    return True
+
+
 def ensure_directories_exist(base_directory, subdirectories):
     """
     Ensure that a list of subdirectories exists within a base directory.
@@ -125,84 +252,234 @@ def ensure_directories_exist(base_directory, subdirectories):
             logging.info(f"Created directory: {directory_path}")
 
 
-def process_exported_attachments(source_dir, dest_documents, dest_images, dest_folders):
+def _scan_folder_tree(folder_path, relative_path="."):
     """
-    Process exported files and organize them into specified directories.
+    Recursively lists a folder with os.scandir.
+
+    Returns:
+        tuple: The relative paths of the folder and all its sub-folders, and a list of
+            (relative path, path, size) for every file in them.
+    """
+    folders = [relative_path]
+    files = []
+    for entry in os.scandir(folder_path):
+        entry_relative_path = os.path.join(relative_path, entry.name)
+        if entry.is_dir():
+            sub_folders, sub_files = _scan_folder_tree(entry.path, entry_relative_path)
+            folders += sub_folders
+            files += sub_files
+        elif entry.is_file():
+            files.append((entry_relative_path, entry.path, entry.stat().st_size))
+    return folders, files
+
+
+def add_notes_file(folder_index, notes_files):
+    """
+    Sets the Notes.md of a thought folder in its index from the files named Notes.md in
+    any case, as on Windows and macOS: "Notes.md" if there is one, otherwise the first by
+    name. Any other variants (only possible on case-sensitive filesystems) are attachments.
+
+    Args:
+        folder_index (dict): The index of the folder, see scan_export_directory.
+        notes_files (list): (name, path, size, mtime_ns) of the folder's Notes.md variants.
+    """
+    if not notes_files:
+        return
+    notes_files = sorted(
+        notes_files, key=lambda notes_file: notes_file[0] != "Notes.md"
+    )
+    _, path, size, mtime_ns = notes_files[0]
+    folder_index["notes"] = {"path": path, "size": size, "mtime_ns": mtime_ns}
+    folder_index["files"] += [
+        (name, path, size) for name, path, size, _ in notes_files[1:]
+    ]
+
+
+def scan_export_directory(source_dir):
+    """
+    Scans the exported Brain directory once with os.scandir and builds an in-memory index
+    of its first-level (thought) folders, so later stages do not need to check the
+    filesystem file by file.
 
     Args:
         source_dir (str): The source directory containing exported files.
+
+    Returns:
+        dict: Folder name (thought ID) -> {
+            "notes": {"path", "size", "mtime_ns"} of its Notes.md (in any case), or None,
+            "files": [(name, path, size)] of its other files,
+            "md_images": [(name, path, size)] of the files in .data/md-images,
+            "folders": [(name, path, relative folder paths, [(relative path, path, size)])]
+                of its other sub-folders and all their content,
+        }
+    """
+    export_index = {}
+    for first_level_entry in os.scandir(source_dir):
+        if not first_level_entry.is_dir():
+            continue
+        folder_index = {"notes": None, "files": [], "md_images": [], "folders": []}
+        export_index[first_level_entry.name] = folder_index
+        notes_files = []
+
+        for entry in os.scandir(first_level_entry.path):
+            try:
+                if entry.is_file():
+                    if entry.name.lower() == "notes.md":
+                        entry_stat = entry.stat()
+                        notes_files.append(
+                            (
+                                entry.name,
+                                entry.path,
+                                entry_stat.st_size,
+                                entry_stat.st_mtime_ns,
+                            )
+                        )
+                    else:
+                        folder_index["files"].append(
+                            (entry.name, entry.path, entry.stat().st_size)
+                        )
+                elif entry.is_dir():
+                    if entry.name == ".data":
+                        md_images_path = os.path.join(entry.path, "md-images")
+                        if os.path.isdir(md_images_path):
+                            for image_entry in os.scandir(md_images_path):
+                                if image_entry.is_file():
+                                    folder_index["md_images"].append(
+                                        (
+                                            image_entry.name,
+                                            image_entry.path,
+                                            image_entry.stat().st_size,
+                                        )
+                                    )
+                    else:
+                        sub_folders, sub_files = _scan_folder_tree(entry.path)
+                        folder_index["folders"].append(
+                            (entry.name, entry.path, sub_folders, sub_files)
+                        )
+            except Exception as e:
+                logging.error(f"Failed to scan: {entry.path}. Error: {e}")
+        add_notes_file(folder_index, sorted(notes_files))
+
+    return export_index
+
+
+def is_within_directory(path, directory):
+    """
+    Returns True if path, once normalised, is directory or inside it.
+    """
+    directory = os.path.normpath(os.path.abspath(directory))
+    path = os.path.normpath(os.path.abspath(path))
+    return os.path.commonpath([path, directory]) == directory
+
+
+def process_exported_attachments(
+    export_source,
+    dest_documents,
+    dest_images,
+    dest_folders,
+    copy_mode="copy",
+    max_workers=8,
+    sync_manifest_path=None,
+    sync_verify_hash=False,
+    export_index=None,
+    journal=None,
+):
+    """
+    Process exported files and organize them into specified directories.
+    The files to copy are collected first and then copied concurrently.
+    With a sync_manifest_path only new or changed files are copied, and files that
+    are no longer in the export are deleted (see attachment_copier.sync_files).
+
+    Args:
+        export_source: The export_source (directory or zip archive) of the exported files.
         dest_documents (str): Destination directory for documents.
         dest_images (str): Destination directory for embedded images.
         dest_folders (str): Destination directory for document folders.
-    """
-    # Traverse the first-level subfolders in the source directory
-    for root, dirs, files in os.walk(source_dir):
-        # Only process the first-level subfolders
-        if root == source_dir:
-            for dir_name in dirs:
-                first_level_dir_path = os.path.join(root, dir_name)
-
-                # Process files in the first-level subfolder
-                for file in os.listdir(first_level_dir_path):
-                    file_path = os.path.join(first_level_dir_path, file)
-                    if os.path.isfile(file_path):
-                        try:
-                            # Skip "Notes.md" files
-                            if file.lower() == "notes.md":
-                                logging.info(f"Skipped file: {file_path}")
-                                continue
-
-                            # Copy files to "data/documents"
-                            shutil.copy(file_path, dest_documents)
-                            logging.info(
-                                f"Copied file: {file_path} to {dest_documents}"
-                            )
-                        except Exception as e:
-                            logging.error(
-                                f"Failed to copy file: {file_path}. Error: {e}"
-                            )
+        copy_mode (str): "copy", "hardlink" or "reflink" (see attachment_copier.COPY_MODES).
+        max_workers (int): The maximum number of files copied at the same time.
+        sync_manifest_path (str): Path of the sync manifest, or None to copy every file.
+        sync_verify_hash (bool): Compare content hashes of files whose mtime changed.
+        export_index (dict): The index from export_source.scan(); the export is scanned if None.
+        journal (migration_checkpoint.ProgressJournal): The progress journal of the migration,
+            files it records as copied are not copied again when the migration is resumed.
 
-                # Process subfolders within the first-level subfolder
-                for sub_dir_name in os.listdir(first_level_dir_path):
-                    sub_dir_path = os.path.join(first_level_dir_path, sub_dir_name)
-                    if os.path.isdir(sub_dir_path):
-                        try:
-                            # Check if the folder is ".data" and contains "md-images"
-                            if sub_dir_name == ".data":
-                                md_images_path = os.path.join(sub_dir_path, "md-images")
-                                if os.path.exists(md_images_path) and os.path.isdir(
-                                    md_images_path
-                                ):
-                                    # Copy files from ".data/md-images" to "data/embedded images"
-                                    for image_file in os.listdir(md_images_path):
-                                        image_file_path = os.path.join(
-                                            md_images_path, image_file
-                                        )
-                                        if os.path.isfile(image_file_path):
-                                            shutil.copy(
-                                                image_file_path,
-                                                dest_images,
-                                            )
-                                            logging.info(
-                                                f"Copied image file: {image_file_path} to {dest_images}"
-                                            )
-                            elif sub_dir_name != ".data":
-                                # Copy other subfolders to "data/document_folders" (including their contents)
-                                destination_folder_path = os.path.join(
-                                    dest_folders, sub_dir_name
-                                )
-                                shutil.copytree(
-                                    sub_dir_path,
-                                    destination_folder_path,
-                                    dirs_exist_ok=True,
-                                )
-                                logging.info(
-                                    f"Copied folder: {sub_dir_path} to {destination_folder_path}"
-                                )
-                        except Exception as e:
-                            logging.error(
-                                f"Failed to process subfolder: {sub_dir_path}. Error: {e}"
-                            )
+    Returns:
+        tuple: The copy summary returned by attachment_copier.copy_files or sync_files,
+            and the copy jobs (destination file path -> source file path).
+    """
+    if export_index is None:
+        export_index = export_source.scan()
+
+    def add_copy_job(destination_directory, destination_path, source_path):
+        # Never write outside the destination directory, e.g. for a crafted zip archive
+        if not is_within_directory(destination_path, destination_directory):
+            logging.error(
+                f"Skipped {source_path}, its destination is outside {destination_directory}: {destination_path}"
+            )
+            return
+        copy_jobs[destination_path] = source_path
+
+    copy_jobs = {}
+    for folder_index in export_index.values():
+        # Copy files to "data/documents", Notes.md files are not in the index's files
+        for name, path, _ in folder_index["files"]:
+            add_copy_job(dest_documents, os.path.join(dest_documents, name), path)
+
+        # Copy files from ".data/md-images" to "data/embedded images"
+        for name, path, _ in folder_index["md_images"]:
+            add_copy_job(dest_images, os.path.join(dest_images, name), path)
+
+        # Copy other subfolders to "data/document_folders" (including their contents)
+        for name, path, sub_folders, sub_files in folder_index["folders"]:
+            destination_folder_path = os.path.join(dest_folders, name)
+            if not is_within_directory(destination_folder_path, dest_folders) or any(
+                not is_within_directory(
+                    os.path.join(destination_folder_path, sub_folder), dest_folders
+                )
+                for sub_folder in sub_folders
+            ):
+                logging.error(
+                    f"Skipped folder {path}, its destination is outside {dest_folders}"
+                )
+                continue
+            try:
+                for sub_folder in sub_folders:
+                    os.makedirs(
+                        os.path.normpath(
+                            os.path.join(destination_folder_path, sub_folder)
+                        ),
+                        exist_ok=True,
+                    )
+            except Exception as e:
+                logging.error(f"Failed to process subfolder: {path}. Error: {e}")
+                continue
+            for relative_path, file_path, _ in sub_files:
+                add_copy_job(
+                    dest_folders,
+                    os.path.normpath(
+                        os.path.join(destination_folder_path, relative_path)
+                    ),
+                    file_path,
+                )
+            logging.info(f"Copying folder: {path} to {destination_folder_path}")
+
+    if sync_manifest_path:
+        copy_summary = attachment_copier.sync_files(
+            copy_jobs,
+            os.path.commonpath([dest_documents, dest_images, dest_folders]),
+            sync_manifest_path,
+            max_workers,
+            copy_mode,
+            sync_verify_hash,
+            export_source,
+            journal,
+        )
+    else:
+        copy_summary = attachment_copier.copy_files(
+            copy_jobs, max_workers, copy_mode, export_source, journal
+        )
+    attachment_copier.log_copy_summary(copy_summary)
+    return copy_summary, copy_jobs
 
 
 def serialise_dicts_to_json(output_files):
@@ -210,10 +487,13 @@ def serialise_dicts_to_json(output_files):
     Serialize a dictionary of JSON data to specified file paths.
 
     Args:
-        output_files (dict): A dictionary where keys are file paths and values are data to serialize.
+        output_files (dict): A dictionary where keys are file paths and values are data to serialize,
+            or functions returning it, so only one file's data is built at a time.
     """
     for file_path, data in output_files.items():
         try:
+            if callable(data):
+                data = data()
             with open(file_path, "w", encoding="utf-8") as outfile:
                 json.dump(data, outfile, indent=4)
             logging.info(f"Serialized data to {file_path}")
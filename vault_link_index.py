@@ -0,0 +1,214 @@
+import os
+import re
+import logging
+import unicodedata
+from attachment_copier import load_manifest, save_manifest
+
+# Obsidian links [[target]], [[target#heading]], [[target|alias]] and embeds ![[target]]
+wiki_link_pattern = re.compile(r"(!?)\[\[([^\[\]\|#\^]+)([^\[\]]*)\]\]")
+
+# Link targets with a file extension (other than .md) are attachments, e.g. [[report.pdf]]
+attachment_target_pattern = re.compile(r"\.[A-Za-z][A-Za-z0-9]{0,4}$")
+
+
+def link_index_path(vault_dir):
+    """
+    Returns the path of the link index of a vault.
+    """
+    return os.path.join(vault_dir, ".thebrain2markdown", "link_index.json")
+
+
+def link_target_key(target):
+    """
+    Returns the key a link target is resolved by: the file name without folders or a .md
+    extension, compared case-insensitively as Obsidian does.
+    """
+    name = target.strip().replace("\\", "/").rsplit("/", 1)[-1]
+    if name.lower().endswith(".md"):
+        name = name[:-3]
+    return unicodedata.normalize("NFC", name).casefold()
+
+
+def has_content_after_yaml(content):
+    """
+    Returns whether a note has any non-blank line outside its YAML frontmatter.
+    """
+    inside_yaml = False
+    for line in content.splitlines():
+        if line.strip() == "---":
+            inside_yaml = not inside_yaml
+        elif not inside_yaml and line.strip():
+            return True
+    return False
+
+
+def extract_link_targets(content):
+    """
+    Returns the sorted, unique targets of the links in a note, split into links to notes
+    and links to attachments.
+
+    Returns:
+        tuple: The note targets and the attachment targets.
+    """
+    targets = {match.group(2).strip() for match in wiki_link_pattern.finditer(content)}
+    attachments = {
+        target
+        for target in targets
+        if not target.lower().endswith(".md")
+        and attachment_target_pattern.search(target)
+    }
+    return sorted(targets - attachments), sorted(attachments)
+
+
+def index_entry(file_path, content=None):
+    """
+    Returns the link index entry of a file, with the links of a note from its content
+    as it is on disk. Other files only record their size and mtime.
+    """
+    file_stat = os.stat(file_path)
+    entry = {"size": file_stat.st_size, "mtime_ns": file_stat.st_mtime_ns}
+    if content is not None:
+        entry["targets"], entry["attachments"] = extract_link_targets(content)
+        entry["empty"] = not has_content_after_yaml(content)
+    return entry
+
+
+def load_link_index(index_path):
+    """
+    Loads a link index: file path relative to the vault -> {"size", "mtime_ns"}, and for notes
+    also their "targets", "attachments" and whether they are "empty" after the YAML frontmatter.
+    """
+    return load_manifest(index_path)
+
+
+def save_link_index(link_index, index_path):
+    """
+    Saves a link index.
+    """
+    save_manifest(link_index, index_path)
+
+
+def update_link_index(vault_dir, link_index):
+    """
+    Brings a link index up to date with a vault. Only notes that are new or whose size or
+    mtime changed are read; files that no longer exist are dropped. Folders starting with "."
+    (e.g. .obsidian) are skipped.
+
+    Args:
+        vault_dir (str): The path to the Obsidian vault.
+        link_index (dict): The index to update in place.
+
+    Returns:
+        int: The number of notes read.
+    """
+    notes_read = 0
+    current_files = set()
+    for root, dirs, files in os.walk(vault_dir):
+        dirs[:] = [folder for folder in dirs if not folder.startswith(".")]
+        for file in files:
+            file_path = os.path.join(root, file)
+            relative_path = os.path.relpath(file_path, vault_dir)
+            current_files.add(relative_path)
+            try:
+                file_stat = os.stat(file_path)
+                entry = link_index.get(relative_path)
+                if (
+                    entry
+                    and entry["size"] == file_stat.st_size
+                    and entry["mtime_ns"] == file_stat.st_mtime_ns
+                ):
+                    continue
+                if not file.lower().endswith(".md"):
+                    link_index[relative_path] = index_entry(file_path)
+                    continue
+                with open(file_path, "r", encoding="utf-8") as f:
+                    link_index[relative_path] = index_entry(file_path, f.read())
+                notes_read += 1
+            except Exception as e:
+                logging.error(f"Failed to index links of '{file_path}': {e}")
+
+    for relative_path in link_index.keys() - current_files:
+        del link_index[relative_path]
+    return notes_read
+
+
+def build_backlinks(link_index):
+    """
+    Returns link target key -> set of the notes (relative paths) that link to it.
+    """
+    backlinks = {}
+    for relative_path, entry in link_index.items():
+        for target in entry.get("targets", []) + entry.get("attachments", []):
+            backlinks.setdefault(link_target_key(target), set()).add(relative_path)
+    return backlinks
+
+
+def rewrite_links(content, renamed_targets):
+    """
+    Rewrites the links to renamed files, keeping any folder, .md extension, heading or alias.
+
+    Args:
+        content (str): The content of a note.
+        renamed_targets (dict): Link target key of the old name -> new name (without .md for notes).
+
+    Returns:
+        str: The updated content.
+    """
+
+    def replace(match):
+        target = match.group(2)
+        new_name = renamed_targets.get(link_target_key(target))
+        if new_name is None:
+            return match.group(0)
+        folder, separator, name = target.strip().rpartition("/")
+        extension = name[-3:] if name.lower().endswith(".md") else ""
+        return f"{match.group(1)}[[{folder}{separator}{new_name}{extension}{match.group(3)}]]"
+
+    return wiki_link_pattern.sub(replace, content)
+
+
+def build_link_report(link_index):
+    """
+    Reports the broken links, orphans and empty notes of a vault from its link index.
+
+    A link is resolved by file name as Obsidian does: [[name]] resolves to any note name.md and
+    [[file.pdf]] to any file file.pdf in the vault. Orphans are files no other note links to.
+
+    Returns:
+        dict: Lists of "broken_links" and "missing_attachments" (each {"note", "target"}),
+            "orphan_notes", "orphan_attachments" and "empty_notes".
+    """
+    file_keys = {link_target_key(os.path.basename(path)) for path in link_index}
+    linked_keys = set()
+    report = {
+        "broken_links": [],
+        "missing_attachments": [],
+        "orphan_notes": [],
+        "orphan_attachments": [],
+        "empty_notes": [],
+    }
+    for relative_path, entry in sorted(link_index.items()):
+        if "targets" not in entry:
+            continue
+        own_key = link_target_key(os.path.basename(relative_path))
+        for report_key, targets in [
+            ("broken_links", entry["targets"]),
+            ("missing_attachments", entry["attachments"]),
+        ]:
+            for target in targets:
+                target_key = link_target_key(target)
+                if target_key != own_key:
+                    linked_keys.add(target_key)
+                if target_key not in file_keys:
+                    report[report_key].append({"note": relative_path, "target": target})
+        if entry["empty"]:
+            report["empty_notes"].append(relative_path)
+
+    for relative_path, entry in sorted(link_index.items()):
+        if link_target_key(os.path.basename(relative_path)) in linked_keys:
+            continue
+        if "targets" in entry:
+            report["orphan_notes"].append(relative_path)
+        else:
+            report["orphan_attachments"].append(relative_path)
+    return report
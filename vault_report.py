@@ -0,0 +1,60 @@
+import json
+import argparse
+import vault_link_index as link_idx
+
+
+def vault_report(vault_dir, update_index=True):
+    """
+    Reports the broken links, orphans and empty notes of an Obsidian vault from its link index,
+    which the migration saves in the vault. Unless update_index is False the index is first
+    brought up to date, reading only the notes that changed since it was saved.
+
+    Args:
+        vault_dir (str): The path to the Obsidian vault.
+        update_index (bool): Bring the index up to date with the vault first.
+
+    Returns:
+        dict: The report, see vault_link_index.build_link_report.
+    """
+    index_path = link_idx.link_index_path(vault_dir)
+    link_index = link_idx.load_link_index(index_path)
+    if update_index:
+        notes_read = link_idx.update_link_index(vault_dir, link_index)
+        if notes_read:
+            link_idx.save_link_index(link_index, index_path)
+        print(f"Link index updated, {notes_read} notes read")
+    return link_idx.build_link_report(link_index)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="List the broken links, orphans and empty notes of an Obsidian vault."
+    )
+    parser.add_argument("vault_dir", help="The path to the Obsidian vault.")
+    parser.add_argument(
+        "--output",
+        default="vault_report.json",
+        help="The JSON file the report is written to (default: vault_report.json).",
+    )
+    parser.add_argument(
+        "--no-update",
+        action="store_true",
+        help="Report from the saved index without checking the vault for changes.",
+    )
+    args = parser.parse_args()
+
+    report = vault_report(args.vault_dir, not args.no_update)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=4, ensure_ascii=False)
+
+    # Print summary
+    print(f"Broken links: {len(report['broken_links'])}")
+    print(f"Missing attachments: {len(report['missing_attachments'])}")
+    print(f"Orphan notes: {len(report['orphan_notes'])}")
+    print(f"Orphan attachments: {len(report['orphan_attachments'])}")
+    print(f"Empty notes: {len(report['empty_notes'])}")
+    print(f"Report written to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
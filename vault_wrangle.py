@@ -0,0 +1,336 @@
+import os
+import re
+import shutil
+import argparse
+import logging
+import migration_functions as mig_funcs
+import vault_link_index as link_idx
+
+# Operations that move or delete files rather than rewrite their content
+# "move_numeric_files": as migrate_all_md_begining_YYYY.py, move date notes (YYYY, YYYY MM, YYYY MM DD)
+# with content to the calendar folder, delete empty date notes and move other empty notes to the
+# empty files folder. Only notes in the top level of the vault are moved.
+# "rename_date_files": as file_date_wrangler.py, rename files in the calendar folder to ISO 8601
+# (YYYY MM DD -> YYYY-MM-DD, YYYY MM -> YYYY-MM) and rewrite the links to them.
+file_operations = ["move_numeric_files", "rename_date_files"]
+
+# Regex to match valid numeric date patterns: YYYY, YYYY MM, YYYY MM DD
+valid_date_pattern = re.compile(r"^\d{4}( \d{2})?( \d{2})?$")
+
+# Regex patterns for renaming dates to ISO 8601, the first match is used
+iso8601_rename_patterns = [
+    (
+        re.compile(r"^(\d{4}) (\d{2}) (\d{2})(.*)$"),
+        r"\1-\2-\3\4",
+    ),  # YYYY MM DD -> YYYY-MM-DD
+    (re.compile(r"^(\d{4}) (\d{2})(.*)$"), r"\1-\2\3"),  # YYYY MM -> YYYY-MM
+]
+
+
+def plan_file_operation(file_name, content, target_dir, target_empty_files_folder):
+    """
+    Decides what move_numeric_files does with a note in the top level of the vault.
+
+    Returns:
+        tuple: ("move", destination folder), ("delete", None) or None to leave the note where it is.
+    """
+    filename_without_extension = os.path.splitext(file_name)[0]
+    has_content = link_idx.has_content_after_yaml(content)
+    if valid_date_pattern.match(filename_without_extension):
+        if has_content:
+            return "move", target_dir
+        return "delete", None
+    if not has_content:
+        return "move", target_empty_files_folder
+    return None
+
+
+def rename_date_files(vault_dir, directory, test_mode=True, link_index=None):
+    """
+    Renames the files in a folder to the ISO 8601 date format (YYYY-MM or YYYY-MM-DD) and
+    rewrites the links to them.
+
+    The notes linking to each file are looked up in the vault's link index, so only those notes
+    are read and rewritten. The index is saved in the vault and brought up to date on each run
+    by reading only the notes that changed since.
+
+    Args:
+        vault_dir (str): The path to the Obsidian vault.
+        directory (str): The folder containing the files to rename.
+        test_mode (bool): If True, only logs the proposed changes without modifying files.
+        link_index (dict): The vault's link index if it is already loaded.
+
+    Returns:
+        dict: The number of files renamed and of notes whose links were rewritten.
+    """
+    index_path = link_idx.link_index_path(vault_dir)
+    if link_index is None:
+        link_index = link_idx.load_link_index(index_path)
+    notes_read = link_idx.update_link_index(vault_dir, link_index)
+    logging.info(f"Link index updated, {notes_read} notes read")
+
+    summary = {"files_renamed": 0, "links_updated": 0}
+    if not os.path.isdir(directory):
+        logging.info(f"No files to rename, {directory} does not exist")
+        return summary
+
+    renamed_targets = {}
+    renamed_files = {}
+    for entry in os.scandir(directory):
+        if not entry.is_file():
+            continue
+        new_filename = entry.name
+        for pattern, replacement in iso8601_rename_patterns:
+            new_filename = pattern.sub(replacement, new_filename)
+            if new_filename != entry.name:
+                break  # Stop after the first successful match
+        if new_filename == entry.name:
+            continue
+
+        new_path = os.path.join(directory, new_filename)
+        if os.path.exists(new_path):
+            logging.error(f"Not renaming '{entry.path}', '{new_path}' already exists")
+            continue
+        if test_mode:
+            logging.info(f"Test: Would rename '{entry.path}' to '{new_path}'")
+        else:
+            try:
+                os.rename(entry.path, new_path)
+                logging.info(f"Renamed '{entry.path}' to '{new_path}'")
+            except Exception as e:
+                logging.error(f"Failed to rename '{entry.path}': {e}")
+                continue
+        summary["files_renamed"] += 1
+
+        is_note = new_filename.lower().endswith(".md")
+        renamed_targets[link_idx.link_target_key(entry.name)] = (
+            new_filename[:-3] if is_note else new_filename
+        )
+        renamed_files[os.path.relpath(entry.path, vault_dir)] = os.path.relpath(
+            new_path, vault_dir
+        )
+
+    if not test_mode:
+        for old_path, new_path in renamed_files.items():
+            if old_path in link_index:
+                link_index[new_path] = link_index.pop(old_path)
+
+    # Rewrite the links in the notes that link to a renamed file
+    backlinks = link_idx.build_backlinks(link_index)
+    linking_notes = set()
+    for target_key in renamed_targets:
+        linking_notes.update(backlinks.get(target_key, ()))
+
+    for relative_path in sorted(linking_notes):
+        file_path = os.path.join(vault_dir, relative_path)
+        try:
+            with open(file_path, "r", encoding="utf-8") as f:
+                content = f.read()
+            updated_content = link_idx.rewrite_links(content, renamed_targets)
+            if updated_content == content:
+                continue
+            summary["links_updated"] += 1
+            if test_mode:
+                logging.info(f"Test: Would update links in '{file_path}'")
+            else:
+                with open(file_path, "w", encoding="utf-8") as f:
+                    f.write(updated_content)
+                link_index[relative_path] = link_idx.index_entry(
+                    file_path, updated_content
+                )
+                logging.info(f"Updated links in '{file_path}'")
+        except Exception as e:
+            logging.error(f"Failed to update links in '{file_path}': {e}")
+
+    if not test_mode:
+        link_idx.save_link_index(link_index, index_path)
+    return summary
+
+
+def vault_wrangle(
+    vault_dir,
+    operations,
+    test_mode=True,
+    target_dir=None,
+    target_empty_files_folder=None,
+):
+    """
+    Applies several wrangling operations to an Obsidian vault in a single walk.
+
+    Every markdown file is read once and all enabled content rewrites (the body transforms
+    registered in migration_functions, e.g. "date_links", "square_bracket_check_boxes" and
+    "check_boxes") are applied to it in memory, so each file is written at most once.
+    Moves and deletes of enabled file_operations are applied after the walk, then renames,
+    which only rewrite the notes that link to the renamed files. Folders starting with "."
+    (e.g. .obsidian) are skipped.
+
+    Args:
+        vault_dir (str): The path to the Obsidian vault.
+        operations (list): Names of body transforms and file_operations to apply.
+        test_mode (bool): If True, only logs the proposed changes without modifying files.
+        target_dir (str): Folder date notes are moved to and renamed in, by default "calendar"
+            in the vault.
+        target_empty_files_folder (str): Folder empty notes are moved to, by default
+            "empty_files" in the vault.
+
+    Returns:
+        dict: The number of files searched, updated, moved, deleted and renamed, and of the
+            notes whose links to renamed files were rewritten.
+    """
+    body_transforms = mig_funcs.get_body_transforms(
+        [operation for operation in operations if operation not in file_operations]
+    )
+    target_dir = target_dir or os.path.join(vault_dir, "calendar")
+    target_empty_files_folder = target_empty_files_folder or os.path.join(
+        vault_dir, "empty_files"
+    )
+
+    logging.info(f"Starting vault wrangling in folder: {vault_dir}")
+    logging.info(f"Operations: {', '.join(operations)}")
+    logging.info(f"Test mode is {'ON' if test_mode else 'OFF'}")
+
+    summary = {
+        "files_searched": 0,
+        "files_updated": 0,
+        "files_moved": 0,
+        "files_deleted": 0,
+    }
+    planned_file_operations = []
+
+    # Notes read by the walk are indexed on the way, so renaming does not read them again
+    link_index = None
+    if "rename_date_files" in operations:
+        link_index = link_idx.load_link_index(link_idx.link_index_path(vault_dir))
+
+    move_numeric_files = "move_numeric_files" in operations
+    for root, dirs, files in os.walk(vault_dir):
+        if not body_transforms and not move_numeric_files:
+            break
+        # Without content rewrites only the notes in the top level are read, for moving
+        dirs[:] = [
+            folder for folder in dirs if body_transforms and not folder.startswith(".")
+        ]
+        in_vault_root = os.path.normpath(root) == os.path.normpath(vault_dir)
+        for file in files:
+            if not file.lower().endswith(".md"):
+                continue
+            file_path = os.path.join(root, file)
+            summary["files_searched"] += 1
+            try:
+                with open(file_path, "r", encoding="utf-8") as f:
+                    content = f.read()
+
+                updated_content = content
+                for body_transform in body_transforms:
+                    updated_content = body_transform(updated_content)
+
+                if updated_content != content:
+                    summary["files_updated"] += 1
+                    if test_mode:
+                        logging.info(f"Test: Would update '{file_path}'")
+                    else:
+                        with open(file_path, "w", encoding="utf-8") as f:
+                            f.write(updated_content)
+                        logging.info(f"Updated '{file_path}'")
+
+                if link_index is not None:
+                    link_index[os.path.relpath(file_path, vault_dir)] = (
+                        link_idx.index_entry(
+                            file_path, content if test_mode else updated_content
+                        )
+                    )
+
+                if move_numeric_files and in_vault_root:
+                    file_operation = plan_file_operation(
+                        file, updated_content, target_dir, target_empty_files_folder
+                    )
+                    if file_operation:
+                        planned_file_operations.append((file_path, *file_operation))
+            except Exception as e:
+                logging.error(f"Failed to process file '{file_path}': {e}")
+
+    # Move and delete files once the walk is complete
+    for file_path, action, destination_folder in planned_file_operations:
+        try:
+            if action == "delete":
+                summary["files_deleted"] += 1
+                if test_mode:
+                    logging.info(f"Test: Would delete '{file_path}'")
+                else:
+                    os.remove(file_path)
+                    logging.info(f"Deleted '{file_path}'")
+            else:
+                destination_path = os.path.join(
+                    destination_folder, os.path.basename(file_path)
+                )
+                summary["files_moved"] += 1
+                if test_mode:
+                    logging.info(
+                        f"Test: Would move '{file_path}' to '{destination_path}'"
+                    )
+                else:
+                    os.makedirs(destination_folder, exist_ok=True)
+                    shutil.move(file_path, destination_path)
+                    logging.info(f"Moved '{file_path}' to '{destination_path}'")
+        except Exception as e:
+            logging.error(f"Failed to {action} file '{file_path}': {e}")
+
+    if link_index is not None:
+        summary.update(rename_date_files(vault_dir, target_dir, test_mode, link_index))
+
+    logging.info("Vault wrangling completed.")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Apply several wrangling operations to an Obsidian vault in a single pass."
+    )
+    parser.add_argument("vault_dir", help="The path to the Obsidian vault.")
+    parser.add_argument(
+        "operations",
+        nargs="+",
+        choices=list(mig_funcs.body_transforms) + file_operations,
+        help="The operations to apply.",
+    )
+    parser.add_argument(
+        "--test-mode",
+        action="store_true",
+        help="Only log the proposed changes without modifying files.",
+    )
+    parser.add_argument(
+        "--target-dir", help="Folder date notes are moved to (default: calendar)."
+    )
+    parser.add_argument(
+        "--empty-files-dir",
+        help="Folder empty notes are moved to (default: empty_files).",
+    )
+    args = parser.parse_args()
+
+    # Configure logging
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+        handlers=[logging.FileHandler("vault_wrangle.log"), logging.StreamHandler()],
+    )
+
+    summary = vault_wrangle(
+        args.vault_dir,
+        args.operations,
+        args.test_mode,
+        args.target_dir,
+        args.empty_files_dir,
+    )
+
+    # Print summary
+    print(f"Files searched: {summary['files_searched']}")
+    print(f"Files updated: {summary['files_updated']}")
+    print(f"Files moved: {summary['files_moved']}")
+    print(f"Files deleted: {summary['files_deleted']}")
+    if "files_renamed" in summary:
+        print(f"Files renamed: {summary['files_renamed']}")
+        print(f"Files with links updated: {summary['links_updated']}")
+
+
+if __name__ == "__main__":
+    main()